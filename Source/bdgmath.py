@@ -1,5 +1,7 @@
 import math
+import array
 import random
+import operator
 import functools
 
 
@@ -27,13 +29,29 @@ class Matrix3:
         return self.components[row][col]
                  
     def mulVec2(self, vec2):
-        v0 = (vec2.x() * self.getComponent(0, 0) +
-              vec2.y() * self.getComponent(1, 0) +
-              self.getComponent(2,0))
-        v1 = (vec2.x() * self.getComponent(0, 1) +
-              vec2.y() * self.getComponent(1, 1) +
-              self.getComponent(2,1))
-        return Vector2(v0, v1)
+        (c00, c10, c20), (c01, c11, c21) = self.components
+        x, y = vec2.components
+        return Vector2(x * c00 + y * c10 + c20,
+                       x * c01 + y * c11 + c21)
+
+    def transformArray(self, points):
+        """ applies this transform to a whole buffer of points at once.
+
+        points may be a Vector2Array, or a flat array('d') of
+        interleaved x, y values; the result is of the same kind.
+        """
+        if isinstance(points, Vector2Array):
+            return Vector2Array(self.transformArray(points.coords))
+
+        # numpy is only needed here, so bdgmath itself stays free of
+        # third-party imports. The array's buffer is viewed as an
+        # n x 2 matrix, so the whole batch goes through one multiply.
+        import numpy as np
+        mat = np.array(self.components)
+        pts = np.frombuffer(points, dtype = np.float64).reshape(-1, 2)
+        out = array.array('d')
+        out.frombytes((pts @ mat[:, :2].T + mat[:, 2]).tobytes())
+        return out
 
     def mulMat3(self, mat3):
         lc = self.components
@@ -87,82 +105,119 @@ def makeTranslationRotationScaleUniform(x, y, r, s):
 
 @functools.total_ordering
 class Vector2:
+    """ a 2d vector. Arithmetic is available both as operators
+    (a + b, a - b, a * s, s * a, -a, a / s, a @ b for the dot product)
+    and as the older named methods (addVec2, subVec2, mulScalar,
+    dot2dVector2), which are aliases of the operators.
+
+    nothing stops you assigning to _x or _y, but vectors get hashed
+    and shared, so treat them as values and make a new one instead.
+    """
+
+    __slots__ = ('_x', '_y')
+
     def __init__(self, x=0.0, y=0.0):
-        self.components = (x,y)
+        self._x = x
+        self._y = y
+
+    @property
+    def components(self):
+        return (self._x, self._y)
 
     def mag(self):
-        xc = self.x()
-        yc = self.y()
+        xc = self._x
+        yc = self._y
         
         return math.sqrt(xc*xc+yc*yc)
 
     def magsqr(self):
-        xc = self.x()
-        yc = self.y()
+        xc = self._x
+        yc = self._y
         
         return xc*xc+yc*yc
 
     # makes a vector in the first quadrant
     def abs(self):
-        cx, cy = self.components
-        return Vector2(abs(cx), abs(cy))
+        return Vector2(abs(self._x), abs(self._y))
 
     def maxScalar(self, v):
-        cx, cy = self.components
-        return Vector2(max(cx, v), max(cy, v))
+        return Vector2(max(self._x, v), max(self._y, v))
 
     def makeUnit(self):
         return self.mulScalar(1.0 / self.mag())
 
     def x(self):
-        return self.components[0]
+        return self._x
 
     def y(self):
-        return self.components[1]
+        return self._y
 
-    def mulScalar(self, s):
-        return Vector2(self.components[0] * s,
-                       self.components[1] * s)
+    def __mul__(self, s):
+        return Vector2(self._x * s,
+                       self._y * s)
 
-    def addVec2(self, other):
-        return Vector2(self.components[0] + other.components[0],
-                       self.components[1] + other.components[1])
+    __rmul__ = __mul__
+    mulScalar = __mul__
 
-    def subVec2(self, other):
-        return Vector2(self.components[0] - other.components[0],
-                       self.components[1] - other.components[1])
+    def __truediv__(self, s):
+        return Vector2(self._x / s,
+                       self._y / s)
+
+    def __add__(self, other):
+        return Vector2(self._x + other._x,
+                       self._y + other._y)
+
+    addVec2 = __add__
+
+    def __sub__(self, other):
+        return Vector2(self._x - other._x,
+                       self._y - other._y)
+
+    subVec2 = __sub__
+
+    def __neg__(self):
+        return Vector2(-self._x, -self._y)
 
     def interpVec2(self, other, t):
         # t = 0 yields this
         # t = 1 yields other
-        delta = other.subVec2(self)
-        return self.addVec2(delta.mulScalar(t))
+        sx = self._x
+        sy = self._y
+        return Vector2(sx + (other._x - sx) * t,
+                       sy + (other._y - sy) * t)
 
     def cross2dVector2(self, other):
-        return self.x()*other.y() - self.y()*other.x()
+        return self._x*other._y - self._y*other._x
 
-    def dot2dVector2(self, other):
-        return self.x()*other.x() + self.y()*other.y()
+    def __matmul__(self, other):
+        return self._x*other._x + self._y*other._y
+
+    dot2dVector2 = __matmul__
 
     def __str__(self):
-        return "<%0.2f %0.2f>" % self.components
+        return "<%0.2f %0.2f>" % (self._x, self._y)
 
     def __repr__(self):
         return str(self)
 
     def __eq__(self, other):
-        return self.x() == other.x() and self.y() == other.y()
+        if not isinstance(other, Vector2):
+            return NotImplemented
+        return self._x == other._x and self._y == other._y
+
+    def __hash__(self):
+        return hash((self._x, self._y))
 
     def __lt__(self, other):
-        if self.x() < other.x():
+        if self._x < other.x():
             return True
-        if self.x() > other.x():
+        if self._x > other.x():
             return False
-        return self.y() < other.y()
+        return self._y < other.y()
 
     def min(self, other):
-        return Vector2(min(self.x(), other.x()),
-                       min(self.y(), other.y()))
+        return Vector2(min(self._x, other._x),
+                       min(self._y, other._y))
 
         
         
@@ -170,52 +225,221 @@ class Vector2:
 def makeUnitVec2FromAngle(theta):
     return Vector2(math.cos(theta), math.sin(theta))
 
+
+class Vector2Array:
+    """ a batch of 2d points, stored interleaved (x0, y0, x1, y1, ...)
+    in a flat array of doubles, so that bulk operations don't allocate
+    a Vector2 per point.
+
+    operations that take an "other" accept either another
+    Vector2Array of the same length, or a single Vector2, which is
+    applied to every point.
+
+    the elementwise operations are plain python over the flat array,
+    so bdgmath needs nothing outside the standard library; only
+    Matrix3.transformArray pulls in numpy, when it's called.
+    """
+
+    def __init__(self, coords=None):
+        if coords is None:
+            self.coords = array.array('d')
+        elif isinstance(coords, array.array):
+            self.coords = coords
+        else:
+            self.coords = array.array('d', coords)
+
+    @classmethod
+    def fromVec2List(cls, vecList):
+        coords = array.array('d')
+        for v in vecList:
+            coords.extend(v.components)
+        return cls(coords)
+
+    @classmethod
+    def fromXYLists(cls, xs, ys):
+        coords = array.array('d', bytes(16 * len(xs)))
+        coords[0::2] = array.array('d', xs)
+        coords[1::2] = array.array('d', ys)
+        return cls(coords)
+
+    def toVec2List(self):
+        c = self.coords
+        return [Vector2(x, y) for x, y in zip(c[0::2], c[1::2])]
+
+    def __len__(self):
+        return len(self.coords) // 2
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return Vector2(self.coords[2 * i], self.coords[2 * i + 1])
+
+    def __iter__(self):
+        c = self.coords
+        return (Vector2(x, y) for x, y in zip(c[0::2], c[1::2]))
+
+    def append(self, v):
+        self.coords.extend(v.components)
+
+    def xs(self):
+        return self.coords[0::2]
+
+    def ys(self):
+        return self.coords[1::2]
+
+    def copy(self):
+        return Vector2Array(array.array('d', self.coords))
+
+    def _otherCoords(self, other):
+        if isinstance(other, Vector2Array):
+            assert(len(other.coords) == len(self.coords))
+            return other.coords
+        return array.array('d', other.components) * len(self)
+
+    def addVec2(self, other):
+        oc = self._otherCoords(other)
+        return Vector2Array(array.array('d', map(operator.add, self.coords, oc)))
+
+    def subVec2(self, other):
+        oc = self._otherCoords(other)
+        return Vector2Array(array.array('d', map(operator.sub, self.coords, oc)))
+
+    def mulScalar(self, s):
+        return Vector2Array(array.array('d', [c * s for c in self.coords]))
+
+    def dot2dVector2(self, other):
+        """ returns a list of per-point dot products """
+        oc = self._otherCoords(other)
+        sc = self.coords
+        return [ax * bx + ay * by for ax, ay, bx, by in
+                zip(sc[0::2], sc[1::2], oc[0::2], oc[1::2])]
+
+    def cross2dVector2(self, other):
+        """ returns a list of per-point 2d cross products """
+        oc = self._otherCoords(other)
+        sc = self.coords
+        return [ax * by - ay * bx for ax, ay, bx, by in
+                zip(sc[0::2], sc[1::2], oc[0::2], oc[1::2])]
+
+    def mag(self):
+        c = self.coords
+        return [math.hypot(x, y) for x, y in zip(c[0::2], c[1::2])]
+
+    def magsqr(self):
+        c = self.coords
+        return [x * x + y * y for x, y in zip(c[0::2], c[1::2])]
+
+    def min(self, other):
+        oc = self._otherCoords(other)
+        return Vector2Array(array.array('d', map(min, self.coords, oc)))
+
+    def interpVec2(self, other, t):
+        # t = 0 yields this
+        # t = 1 yields other
+        oc = self._otherCoords(other)
+        return Vector2Array(array.array('d', [a + (b - a) * t for a, b in zip(self.coords, oc)]))
+
+    def bounds(self):
+        """ returns (minX, minY, maxX, maxY), or None if empty """
+        if not self.coords:
+            return None
+        xs = self.coords[0::2]
+        ys = self.coords[1::2]
+        return (min(xs), min(ys), max(xs), max(ys))
+
+    def transform(self, mat3):
+        return mat3.transformArray(self)
+
+    def __str__(self):
+        return "[" + " ".join(str(v) for v in self) + "]"
+
+    def __repr__(self):
+        return str(self)
+
 class Vector3:
+    """ a 3d vector, to be treated as a value like Vector2 (don't
+    assign to its fields). Like Vector2, arithmetic is available
+    as operators (+, -, * by a scalar, @ for the dot product) and as
+    the older named methods.
+    """
+
+    __slots__ = ('_x', '_y', '_z')
+
     def __init__(self, x=0.0, y=0.0, z=0.0, components=None):
         if components:
-            self.components = components
-        else:
-            self.components = (x,y,z)
+            x, y, z = components
+        self._x = x
+        self._y = y
+        self._z = z
+
+    @property
+    def components(self):
+        return (self._x, self._y, self._z)
 
     def mag(self):
-        xc, yc, zc = self.components
+        xc = self._x
+        yc = self._y
+        zc = self._z
         return math.sqrt(xc*xc + yc*yc + zc*zc)
 
     def magsqr(self):
-        xc, yc, zc = self.components
+        xc = self._x
+        yc = self._y
+        zc = self._z
         
         return xc*xc + yc*yc + zc*zc
 
     def abs(self):
-        return Vector3(*[abs(c) for c in self.components])
+        return Vector3(abs(self._x), abs(self._y), abs(self._z))
 
     def maxScalar(self, v):
-        return Vector3(*[max(c, v) for c in self.components])
+        return Vector3(max(self._x, v), max(self._y, v), max(self._z, v))
     
     def x(self):
-        return self.components[0]
+        return self._x
 
     def y(self):
-        return self.components[1]
+        return self._y
 
     def z(self):
-        return self.components[2]
+        return self._z
 
     def makeUnit(self):
         return self.mulScalar(1.0 / self.mag())
 
-    def mulScalar(self, s):
-        return Vector3(components = [c * s for c in self.components])
+    def __mul__(self, s):
+        return Vector3(self._x * s, self._y * s, self._z * s)
+
+    __rmul__ = __mul__
+    mulScalar = __mul__
+
+    def __truediv__(self, s):
+        return Vector3(self._x / s, self._y / s, self._z / s)
 
-    def addVec3(self, other):
-        return Vector3(components = [self.components[i] + other.components[i] for i in range(3)])
+    def __add__(self, other):
+        return Vector3(self._x + other._x,
+                       self._y + other._y,
+                       self._z + other._z)
 
-    def subVec3(self, other):
-        return Vector3(components = [self.components[i] - other.components[i] for i in range(3)])
+    addVec3 = __add__
+
+    def __sub__(self, other):
+        return Vector3(self._x - other._x,
+                       self._y - other._y,
+                       self._z - other._z)
+
+    subVec3 = __sub__
+
+    def __neg__(self):
+        return Vector3(-self._x, -self._y, -self._z)
 
     def cross(self, other):
-        ax, ay, az = self.components
-        bx, by, bz = other.components
+        ax = self._x
+        ay = self._y
+        az = self._z
+        bx = other._x
+        by = other._y
+        bz = other._z
 
         cx = ay * bz - az * by
         cy = az * bx - ax * bz
@@ -223,16 +447,25 @@ class Vector3:
 
         return Vector3(cx, cy, cz)
 
-    def dot(self, other):
-        scomp = self.components
-        ocomp = other.components
+    def __matmul__(self, other):
+        return (self._x * other._x +
+                self._y * other._y +
+                self._z * other._z)
+
+    dot = __matmul__
+
+    def __eq__(self, other):
+        if not isinstance(other, Vector3):
+            return NotImplemented
+        return (self._x == other._x and
+                self._y == other._y and
+                self._z == other._z)
 
-        return (scomp[0] * ocomp[0] +
-                scomp[1] * ocomp[1] +
-                scomp[2] * ocomp[2])
+    def __hash__(self):
+        return hash((self._x, self._y, self._z))
 
     def __str__(self):
-        return "<%0.2f %0.2f %02f>" % self.components
+        return "<%0.2f %0.2f %02f>" % (self._x, self._y, self._z)
 
     def __repr__(self):
         return str(self)
@@ -250,30 +483,54 @@ class Matrix4:
         return self.components[row][col]
                  
     def mulVec3(self, vec3):
-        v0 = (vec3.x() * self.getComponent(0, 0) +
-              vec3.y() * self.getComponent(1, 0) +
-              vec3.z() * self.getComponent(2, 0) +
-              self.getComponent(3,0))
-        v1 = (vec3.x() * self.getComponent(0, 1) +
-              vec3.y() * self.getComponent(1, 1) +
-              vec3.z() * self.getComponent(2, 1) +
-              self.getComponent(3,1))
-        v2 = (vec3.x() * self.getComponent(0, 2) +
-              vec3.y() * self.getComponent(1, 2) +
-              vec3.z() * self.getComponent(2, 2) +
-              self.getComponent(3,2))
-        return Vector3(v0, v1, v2)
+        (c00, c10, c20, c30), (c01, c11, c21, c31), (c02, c12, c22, c32) = self.components
+        x, y, z = vec3.components
+        return Vector3(x * c00 + y * c10 + z * c20 + c30,
+                       x * c01 + y * c11 + z * c21 + c31,
+                       x * c02 + y * c12 + z * c22 + c32)
+
+    def mulMat4(self, mat4):
+        """ composes two transforms, the result applies mat4 first,
+        then this matrix """
+        lc = self.components
+        rc = mat4.components
+
+        out = []
+        for row in range(3):
+            l0, l1, l2, l3 = lc[row]
+            for col in range(4):
+                out.append(l0 * rc[0][col] + l1 * rc[1][col] + l2 * rc[2][col])
+            out[-1] += l3
+
+        return Matrix4(*out)
+
+    def transformArray(self, points):
+        """ applies this transform to a flat array('d') of interleaved
+        x, y, z values, returning a new array """
+        import numpy as np
+        mat = np.array(self.components)
+        pts = np.frombuffer(points, dtype = np.float64).reshape(-1, 3)
+        out = array.array('d')
+        out.frombytes((pts @ mat[:, :3].T + mat[:, 3]).tobytes())
+        return out
 
     def __str__(self):
-        return "TODO"
         c = self.components
-        s = """[%0.2f %0.2f %0.2f]
-[%0.2f %0.2f %0.2f]""" % (c[0][0], c[0][1], c[0][2],
-                          c[1][0], c[1][1], c[1][2])
+        s = """[%0.2f %0.2f %0.2f %0.2f]
+[%0.2f %0.2f %0.2f %0.2f]
+[%0.2f %0.2f %0.2f %0.2f]""" % (c[0] + c[1] + c[2])
         return s
 
-    
         
+def makeTranslationMat4(x, y, z):
+    return Matrix4(1, 0, 0, x,
+                   0, 1, 0, y,
+                   0, 0, 1, z)
+
+def makeScaleMat4(sx, sy, sz):
+    return Matrix4(sx, 0, 0, 0,
+                   0, sy, 0, 0,
+                   0, 0, sz, 0)
 
 def makeRotationMat4RadiansX(r):
     c = math.cos(r)
@@ -315,22 +572,36 @@ class LineSegment2d:
         return LineSegment2d(tv0, tv1)
 
     
-def genSampleList(startVal, endVal, endCount, genCount = -1):
-    if genCount < endCount:
-        genCount = endCount * 10
-
-    samples = [startVal, endVal]
-    while len(samples) < genCount:
-        samples.append(random.uniform(startVal, endVal))
-
-    samples.sort()
-    outSamples = []
-    for i in range(endCount - 1):
-        gI = int(i * genCount / endCount)
-        outSamples.append(samples[gI])
-    outSamples.append(samples[-1])
-
-    return outSamples
+def genStratifiedSamples(startVal, endVal, count, rng = None):
+    """ yields count sorted values from startVal to endVal, roughly
+    evenly spaced but jittered: the first and last values are exactly
+    startVal and endVal, and each value in between is uniformly
+    random within its own stratum, so the output is already sorted.
+
+    pass a random.Random (eg random.Random(seed)) as rng to get the
+    same sequence every time.
+    """
+    if rng is None:
+        rng = random
+
+    if count == 1:
+        yield endVal
+        return
+    if count < 1:
+        return
+
+    stratumWidth = (endVal - startVal) / (count - 1)
+
+    yield startVal
+    for i in range(1, count - 1):
+        yield startVal + (i + rng.uniform(-0.5, 0.5)) * stratumWidth
+    yield endVal
+
+
+def genSampleList(startVal, endVal, endCount, genCount = -1, rng = None):
+    # genCount used to control how many values were generated and
+    # thinned down to endCount, it's kept so old callers still work
+    return list(genStratifiedSamples(startVal, endVal, endCount, rng))
     
 
 def intersectSegments(s1v1, s1v2,
@@ -424,15 +695,19 @@ def makeQuadBezier(p0, p1, p2, numSamples):
     # from https://en.wikipedia.org/wiki/B%C3%A9zier_curve
     points = []
 
-    d01 = p0.subVec2(p1)
-    d21 = p2.subVec2(p1)
+    p1x, p1y = p1.components
+    d01x = p0.x() - p1x
+    d01y = p0.y() - p1y
+    d21x = p2.x() - p1x
+    d21y = p2.y() - p1y
     
     step = 1 / (numSamples - 1)
     for si in range(0, numSamples):
         t = si * step
         oneMinusTSqr = (1-t) * (1-t)
-        pt = p1.addVec2(d01.mulScalar(oneMinusTSqr)).addVec2(d21.mulScalar(t*t))
-        points.append(pt)
+        tSqr = t * t
+        points.append(Vector2(p1x + d01x * oneMinusTSqr + d21x * tSqr,
+                              p1y + d01y * oneMinusTSqr + d21y * tSqr))
     return points
 
 
@@ -442,18 +717,125 @@ def makeCubicBezier(p0, p1, p2, p3, numSamples):
 
     step = 1 / (numSamples - 1)
     for si in range(0, numSamples):
-        t = si * step
+        points.append(evalCubicBezier(p0, p1, p2, p3, si * step))
+    return points
 
-        oneMinusT = (1 - t)
-        oneMinusTSquared = oneMinusT * oneMinusT
-        oneMinusTCubed = oneMinusTSquared * oneMinusT
 
-        pt = p0.mulScalar(oneMinusTCubed).addVec2(
-            p1.mulScalar(3 * t * oneMinusTSquared)).addVec2(
-                p2.mulScalar(3 * t * t * oneMinusT)).addVec2(
-                    p3.mulScalar(t * t * t))
-        points.append(pt)
+def evalCubicBezier(p0, p1, p2, p3, t):
+    oneMinusT = (1 - t)
+    oneMinusTSquared = oneMinusT * oneMinusT
+
+    # Bernstein weights
+    w0 = oneMinusTSquared * oneMinusT
+    w1 = 3 * t * oneMinusTSquared
+    w2 = 3 * t * t * oneMinusT
+    w3 = t * t * t
+
+    return Vector2(p0.x() * w0 + p1.x() * w1 + p2.x() * w2 + p3.x() * w3,
+                   p0.y() * w0 + p1.y() * w1 + p2.y() * w2 + p3.y() * w3)
+
+
+# Adaptive flattening: rather than a fixed sample count, pick the
+# number of segments from a bound on the curve's second derivative
+# (Wang's formula), so that no point on the curve is further than
+# tolerance from the polyline. Then walk the curve with forward
+# differencing, which costs a few additions per point.
+#
+# The count is capped at maxSegments, so a tiny tolerance on a huge
+# curve can't ask for millions of points. A curve that hits the cap
+# gets maxSegments evenly spaced segments, and may then stray further
+# than tolerance; scale the tolerance with the drawing to avoid that.
+
+def bezierSegmentCount(degree, secondDiffMag, tolerance, maxSegments = 1000):
+    if not tolerance > 0:
+        raise ValueError("flattening tolerance must be positive, got %r" % (tolerance,))
+    # Wang's formula: n >= sqrt(d (d - 1) / 8 * M / tolerance)
+    n = math.ceil(math.sqrt(degree * (degree - 1) / 8 * secondDiffMag / tolerance))
+    return clamp(n, 1, maxSegments)
+
+
+def flattenQuad(p0, p1, p2, tolerance = 0.1):
+    p0x, p0y = p0.components
+    p1x, p1y = p1.components
+    p2x, p2y = p2.components
+
+    # polynomial form: a t^2 + b t + p0
+    ax = p0x - 2 * p1x + p2x
+    ay = p0y - 2 * p1y + p2y
+    bx = 2 * (p1x - p0x)
+    by = 2 * (p1y - p0y)
+
+    n = bezierSegmentCount(2, math.hypot(ax, ay), tolerance)
+    h = 1.0 / n
+    hh = h * h
+
+    fx = p0x
+    fy = p0y
+    dfx = ax * hh + bx * h
+    dfy = ay * hh + by * h
+    ddfx = 2 * ax * hh
+    ddfy = 2 * ay * hh
+
+    points = [p0]
+    for i in range(n - 1):
+        fx += dfx
+        fy += dfy
+        dfx += ddfx
+        dfy += ddfy
+        points.append(Vector2(fx, fy))
+    points.append(p2)
     return points
-        
-                
-                    
+
+
+def flattenCubic(p0, p1, p2, p3, tolerance = 0.1):
+    p0x, p0y = p0.components
+    p1x, p1y = p1.components
+    p2x, p2y = p2.components
+    p3x, p3y = p3.components
+
+    secondDiff = max(math.hypot(p0x - 2 * p1x + p2x, p0y - 2 * p1y + p2y),
+                     math.hypot(p1x - 2 * p2x + p3x, p1y - 2 * p2y + p3y))
+    n = bezierSegmentCount(3, secondDiff, tolerance)
+
+    # polynomial form: a t^3 + b t^2 + c t + p0
+    ax = p3x - p0x + 3 * (p1x - p2x)
+    ay = p3y - p0y + 3 * (p1y - p2y)
+    bx = 3 * (p0x - 2 * p1x + p2x)
+    by = 3 * (p0y - 2 * p1y + p2y)
+    cx = 3 * (p1x - p0x)
+    cy = 3 * (p1y - p0y)
+
+    h = 1.0 / n
+    hh = h * h
+    hhh = hh * h
+
+    fx = p0x
+    fy = p0y
+    dfx = ax * hhh + bx * hh + cx * h
+    dfy = ay * hhh + by * hh + cy * h
+    ddfx = 6 * ax * hhh + 2 * bx * hh
+    ddfy = 6 * ay * hhh + 2 * by * hh
+    dddfx = 6 * ax * hhh
+    dddfy = 6 * ay * hhh
+
+    points = [p0]
+    for i in range(n - 1):
+        fx += dfx
+        fy += dfy
+        dfx += ddfx
+        dfy += ddfy
+        ddfx += dddfx
+        ddfy += dddfy
+        points.append(Vector2(fx, fy))
+    points.append(p3)
+    return points
+
+
+def flattenQuads(curves, tolerance = 0.1):
+    """ curves is a list of (p0, p1, p2) tuples, returns a list of polylines """
+    return [flattenQuad(p0, p1, p2, tolerance) for p0, p1, p2 in curves]
+
+
+def flattenCubics(curves, tolerance = 0.1):
+    """ curves is a list of (p0, p1, p2, p3) tuples, returns a list of polylines """
+    return [flattenCubic(p0, p1, p2, p3, tolerance) for p0, p1, p2, p3 in curves]
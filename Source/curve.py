@@ -59,16 +59,7 @@ class CubicBezier(Curve):
 
     def eval(self, t):
         p0, p1, p2, p3 = self.points
-        
-        oneMinusT = (1 - t)
-        oneMinusTSquared = oneMinusT * oneMinusT
-        oneMinusTCubed = oneMinusTSquared * oneMinusT
-
-        pt = p0.mulScalar(oneMinusTCubed).addVec2(
-            p1.mulScalar(3 * t * oneMinusTSquared)).addVec2(
-                p2.mulScalar(3 * t * t * oneMinusT)).addVec2(
-                    p3.mulScalar(t * t * t))
-        return pt
+        return m.evalCubicBezier(p0, p1, p2, p3, t)
 
     def gen_samples(self, linear_increment=1):
         last_point = self.points[0]
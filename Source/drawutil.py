@@ -1,6 +1,7 @@
 import drawSvg as draw
 import bdgmath as m
 import random
+import array
 
 def drawPolyline(dwg, vecList, strokeColor = 'black', strokeWidth = 2):
     p = draw.Path(stroke = strokeColor, fill='none', stroke_width = strokeWidth)
@@ -26,10 +27,33 @@ def drawPolylines(dwg, polylineList, strokeColor = 'black', strokeWidth = 2):
 
 
 def transformPolyLine(vecList, mat):
+    if isinstance(vecList, m.Vector2Array):
+        return mat.transformArray(vecList)
     return [mat.mulVec2(v) for v in vecList]
 
 def transformPolyLines(polyLineList, mat):
-    return [transformPolyLine(p, mat) for p in polyLineList]
+    """ transforms each polyline by mat. Only Vector2Array polylines
+    get the batched path: they're packed into one buffer, transformed
+    in a single pass, then split back up. Lists of Vector2 still go
+    point by point through mulVec2, which is several times slower on
+    big inputs, so convert them with Vector2Array.fromVec2List first
+    if speed matters. """
+    packed = array.array('d')
+    for pl in polyLineList:
+        if isinstance(pl, m.Vector2Array):
+            packed.extend(pl.coords)
+    transformed = mat.transformArray(packed)
+
+    outPolyLines = []
+    start = 0
+    for pl in polyLineList:
+        if isinstance(pl, m.Vector2Array):
+            end = start + len(pl.coords)
+            outPolyLines.append(m.Vector2Array(transformed[start:end]))
+            start = end
+        else:
+            outPolyLines.append([mat.mulVec2(v) for v in pl])
+    return outPolyLines
 
 def pickPointsInBox(x0, y0, x1, y1, n, r):
     points = []
@@ -1,90 +1,483 @@
 import math
+import itertools
+import collections
+
 import bdgmath as m
 import drawSvg as draw
+import simplify
+import overlap
+import pathorder
 
 ###
 # TODO
-# add a vertex dictionary, with a "toKey" method
-# def toKey(Vector2) -> hashableTuple
-# this should speed up insertVert
-#
-# when picking a path to add a segment to, collect many (all?) legal previous paths,
-# and prefer the one that is currently longest
-#
 # when yielding the paths, do so in sorted (x-start?) order, potentially flipping paths
 # end-to-end so that the end that's lower in x is the preferred start point
 
 EPSILON = 10e-2
 
+class EdgePath:
+    """ a path of vertex indices, which can be extended at either end,
+    or reversed, in O(1) """
+
+    __slots__ = ('verts', 'flipped')
+
+    def __init__(self, verts = ()):
+        self.verts = collections.deque(verts)
+        # when flipped, the path reads from the right end of verts
+        self.flipped = False
+
+    def first(self):
+        return self.verts[-1] if self.flipped else self.verts[0]
+
+    def last(self):
+        return self.verts[0] if self.flipped else self.verts[-1]
+
+    def reverse(self):
+        self.flipped = not self.flipped
+
+    def append(self, vi):
+        if self.flipped:
+            self.verts.appendleft(vi)
+        else:
+            self.verts.append(vi)
+
+    def extend(self, vis):
+        if self.flipped:
+            self.verts.extendleft(vis)
+        else:
+            self.verts.extend(vis)
+
+    def prepend(self, vis):
+        """ puts the sequence vis, in order, in front of this path """
+        if self.flipped:
+            self.verts.extend(reversed(vis))
+        else:
+            self.verts.extendleft(reversed(vis))
+
+    def __iter__(self):
+        if self.flipped:
+            return reversed(self.verts)
+        return iter(self.verts)
+
+    def __len__(self):
+        return len(self.verts)
+
+    def toList(self):
+        return list(self)
+
+
 class EdgePool:
     def __init__(self):
         # list of world vertices
         self.vertices = []
 
-        # list of lists of vertex indices
-        self.paths = []
+        # path id -> EdgePath. Ids only ever increase, so this keeps the
+        # paths in the order they were made
+        self.pathsById = {}
+        self.nextPathId = 0
+
+        # vertex index -> ids of the paths that start or end there
+        self.pathEnds = {}
+
+        # set of (low, high) vertex index pairs that are already edges
+        self.connectedVerts = set()
 
-        self.connectedVerts = []
+        # spatial hash of vertex indices, keyed on EPSILON-sized cells,
+        # each a tuple of indices in ascending order
+        self.vertexGrid = {}
         
+    @property
+    def paths(self):
+        """ list of lists of vertex indices """
+        return [p.toList() for p in self.pathsById.values()]
+
+    def addPath(self, path):
+        pathId = self.nextPathId
+        self.nextPathId += 1
+        self.pathsById[pathId] = path
+        for vi in (path.first(), path.last()):
+            if vi in self.pathEnds:
+                self.pathEnds[vi].append(pathId)
+            else:
+                self.pathEnds[vi] = [pathId]
+        return pathId
+
+    def removePath(self, pathId):
+        path = self.pathsById.pop(pathId)
+        for vi in (path.first(), path.last()):
+            ends = self.pathEnds[vi]
+            ends.remove(pathId)
+            if not ends:
+                del self.pathEnds[vi]
+        return path
 
     def getPath(self, vertIndex, atEnd):
-        for pi, p in enumerate(self.paths):
-            #print(f"checking path {pi} {p}")
-            if p[0] == vertIndex:
-                self.paths.pop(pi)
-                if atEnd:
-                    p.reverse()
-                return p
-            if p[-1] == vertIndex:
-                self.paths.pop(pi)
-                if not atEnd:
-                    p.reverse()
-                return p
-        return None
+        """ removes and returns the oldest path that starts or ends at
+        vertIndex, oriented so that it ends there (if atEnd) or starts
+        there (if not), or None if there isn't one """
+        ends = self.pathEnds.get(vertIndex)
+        if not ends:
+            return None
+
+        p = self.removePath(min(ends))
+        if p.first() == vertIndex:
+            if atEnd:
+                p.reverse()
+        elif not atEnd:
+            p.reverse()
+        return p
 
-    def insertVert(self, v):
-        for oi, other in enumerate(self.vertices):
-            d = v.subVec2(other).mag()
+    def toKey(self, v):
+        return (math.floor(v.x() / EPSILON), math.floor(v.y() / EPSILON))
 
-            if d < EPSILON:
-                return oi
+    def storeVert(self, v):
         self.vertices.append(v)
         return len(self.vertices) - 1
 
+    def insertVert(self, v):
+        # any vertex within EPSILON of v is in v's cell or one of its
+        # eight neighbors. Like the old linear scan, prefer the
+        # earliest vertex if there are several in range.
+        cx, cy = self.toKey(v)
+        vx, vy = v.components
+        epsSqr = EPSILON * EPSILON
+
+        found = None
+        for nx in (cx - 1, cx, cx + 1):
+            for ny in (cy - 1, cy, cy + 1):
+                cell = self.vertexGrid.get((nx, ny))
+                if cell is None:
+                    continue
+                for oi in cell:
+                    if found is not None and oi > found:
+                        break
+                    other = self.vertices[oi]
+                    dx = vx - other.x()
+                    dy = vy - other.y()
+                    if dx * dx + dy * dy < epsSqr:
+                        found = oi
+                        break
+        if found is not None:
+            return found
+
+        # cells are tuples, which, holding only ints, the garbage
+        # collector soon stops tracking; a cell rarely holds more than
+        # one or two vertices, so copying one to add to it is cheap
+        vi = self.storeVert(v)
+        key = (cx, cy)
+        self.vertexGrid[key] = self.vertexGrid.get(key, ()) + (vi,)
+        return vi
+
     def addEdge(self, seg):
         v0, v1 = seg
-        v0i = self.insertVert(v0)
-        v1i = self.insertVert(v1)
+        self.addEdgeIndices(self.insertVert(v0), self.insertVert(v1))
 
+    def addEdgeIndices(self, v0i, v1i):
+        """ adds an edge between two vertices already in the pool """
         indexTuple = (min(v0i, v1i), max(v0i, v1i))
         if indexTuple in self.connectedVerts:
             return
-        self.connectedVerts.append(indexTuple)
-
-        #print(f"adding edge {v0i} {v1i}")
+        self.connectedVerts.add(indexTuple)
 
         prePath = self.getPath(v0i, True)
         postPath = self.getPath(v1i, False)
 
+        # the new path is prePath + [v1i] + postPath[1:], built by
+        # extending whichever side is longer
         if prePath is None:
-            p = [v0i, v1i]
+            if postPath is None:
+                p = EdgePath([v0i, v1i])
+            else:
+                p = postPath
+                p.prepend([v0i])
+        elif postPath is None:
+            p = prePath
+            p.append(v1i)
+        elif len(prePath) >= len(postPath):
+            p = prePath
+            p.append(v1i)
+            p.extend(itertools.islice(postPath, 1, None))
         else:
-            p = prePath + [v1i]
-
-        if not (postPath is None):
-            p = p + postPath[1:]
-
-        #print(f"adding {p} to paths")
+            p = postPath
+            p.prepend(prePath.toList())
 
-        self.paths.append(p)
+        self.addPath(p)
 
     def addEdgeList(self, edge_list):
         for i in range(1, len(edge_list)):
             j = i - 1
             self.addEdge((edge_list[j], edge_list[i]))
 
-    def getPaths(self):
+    def setPaths(self, pathLists):
+        """ replaces every path in the pool with pathLists, a list of
+        lists of vertex indices """
+        self.pathsById = {}
+        self.pathEnds = {}
+        for p in pathLists:
+            self.addPath(EdgePath(p))
+
+    def pathLength(self, p):
+        """ length, in world units, of a list of vertex indices """
+        total = 0.0
+        for i in range(1, len(p)):
+            a = self.vertices[p[i - 1]]
+            b = self.vertices[p[i]]
+            total += math.hypot(b.x() - a.x(), b.y() - a.y())
+        return total
+
+    def mergePaths(self, tolerance = EPSILON):
+        """ a post-pass that joins paths to save pen lifts.
+
+        First, paths whose endpoints are within tolerance of each
+        other are joined end to end, reversing them as needed. Longer
+        paths go first, and when several paths could be joined at one
+        end (say, at a T-junction), the longest is preferred.
+
+        Then, closed loops that touch another path at any vertex
+        (again, within tolerance) are spliced into that path there,
+        so the loop gets drawn without lifting the pen.
+
+        returns the number of paths (ie pen lifts) before and after.
+        """
+        paths = [EdgePath(p) for p in self.pathsById.values()]
+        numPaths = len(paths)
+        lengths = [self.pathLength(p.toList()) for p in paths]
+        alive = [True] * numPaths
+        tolSqr = tolerance * tolerance
+
+        def toKey(vi):
+            v = self.vertices[vi]
+            return (math.floor(v.x() / tolerance), math.floor(v.y() / tolerance))
+
+        def near(vi, wi):
+            if vi == wi:
+                return True
+            a = self.vertices[vi]
+            b = self.vertices[wi]
+            dx = a.x() - b.x()
+            dy = a.y() - b.y()
+            return dx * dx + dy * dy <= tolSqr
+
+        def neighborCells(vi):
+            kx, ky = toKey(vi)
+            for nx in (kx - 1, kx, kx + 1):
+                for ny in (ky - 1, ky, ky + 1):
+                    yield (nx, ny)
+
+        def addBridge(vi, wi):
+            # joins between nearby, but different, vertices draw an
+            # edge that wasn't in the pool, so record it like any other
+            if vi != wi:
+                self.connectedVerts.add((min(vi, wi), max(vi, wi)))
+
+        # endpoint grid: cell -> set of (pathIndex, atEnd)
+        endGrid = {}
+
+        def addEnds(pi):
+            p = paths[pi]
+            endGrid.setdefault(toKey(p.first()), set()).add((pi, False))
+            endGrid.setdefault(toKey(p.last()), set()).add((pi, True))
+
+        def removeEnds(pi):
+            p = paths[pi]
+            endGrid[toKey(p.first())].discard((pi, False))
+            endGrid[toKey(p.last())].discard((pi, True))
+
+        for pi in range(numPaths):
+            addEnds(pi)
+
+        for pi in sorted(range(numPaths), key = lambda i: -lengths[i]):
+            if not alive[pi]:
+                continue
+            for atEnd in (True, False):
+                while True:
+                    p = paths[pi]
+                    vi = p.last() if atEnd else p.first()
+
+                    best = None
+                    for key in neighborCells(vi):
+                        for qi, qAtEnd in endGrid.get(key, ()):
+                            if qi == pi:
+                                continue
+                            q = paths[qi]
+                            if not near(vi, q.last() if qAtEnd else q.first()):
+                                continue
+                            candidate = (lengths[qi], -qi, qAtEnd)
+                            if best is None or candidate > best:
+                                best = candidate
+                    if best is None:
+                        break
+
+                    qi = -best[1]
+                    qAtEnd = best[2]
+
+                    removeEnds(pi)
+                    removeEnds(qi)
+
+                    # join so that p's joining end meets q's joining
+                    # start. Reversing an EdgePath is free, so this
+                    # only costs as much as q is long
+                    if not atEnd:
+                        p.reverse()
+                        atEnd = True
+                    q = paths[qi]
+                    if qAtEnd:
+                        q.reverse()
+                    a = p.last()
+                    b = q.first()
+                    if a == b:
+                        p.extend(itertools.islice(q, 1, None))
+                    else:
+                        p.extend(q)
+                        lengths[pi] += self.pathLength((a, b))
+                        addBridge(a, b)
+
+                    lengths[pi] += lengths[qi]
+                    alive[qi] = False
+                    paths[qi] = None
+                    addEnds(pi)
+
+        paths = [p.toList() if p is not None else None for p in paths]
+
+        # stitch closed loops into paths that they touch. owner tracks
+        # which path a spliced loop's vertices ended up in.
+        owner = list(range(numPaths))
+
+        # splicing into the middle of a list is slow, so splices are
+        # only noted down here, and made in one pass when the host is
+        # done: host path index -> vertex index -> [loop vertices to go
+        # in after that vertex]
+        splices = {}
+
+        def spliceLoops(pi):
+            # each loop goes in after the first time its vertex comes
+            # up, which may be in another loop spliced in
+            waiting = splices.pop(pi, {})
+            out = []
+            stack = [iter(paths[pi])]
+            while stack:
+                vi = next(stack[-1], None)
+                if vi is None:
+                    stack.pop()
+                    continue
+                out.append(vi)
+                for insert in waiting.pop(vi, ()):
+                    stack.append(iter(insert))
+            return out
+
+        def findOwner(pi):
+            while owner[pi] != pi:
+                owner[pi] = owner[owner[pi]]
+                pi = owner[pi]
+            return pi
+
+        # vertex grid: cell -> list of (vertexIndex, pathIndex)
+        vertGrid = {}
+        for pi in range(numPaths):
+            if alive[pi]:
+                for vi in paths[pi]:
+                    vertGrid.setdefault(toKey(vi), []).append((vi, pi))
+
+        loops = [pi for pi in range(numPaths)
+                 if alive[pi] and len(paths[pi]) > 2 and near(paths[pi][0], paths[pi][-1])]
+        loops.sort(key = lambda i: lengths[i])
+
+        for li in loops:
+            if findOwner(li) != li:
+                continue
+            loop = paths[li] = spliceLoops(li)
+
+            best = None
+            for loopPos, vi in enumerate(loop):
+                for key in neighborCells(vi):
+                    for wi, hi in vertGrid.get(key, ()):
+                        hi = findOwner(hi)
+                        if hi == li or not near(vi, wi):
+                            continue
+                        candidate = (lengths[hi], -hi, loopPos, wi)
+                        if best is None or candidate > best:
+                            best = candidate
+            if best is None:
+                continue
+
+            hi = -best[1]
+            loopPos = best[2]
+            wi = best[3]
+
+            # rotate the loop to start and end at the touching vertex
+            ring = loop[:-1] if loop[0] == loop[-1] else loop
+            addBridge(loop[-1], loop[0])
+            loopPos = loopPos % len(ring)
+            rotated = ring[loopPos:] + ring[:loopPos] + [ring[loopPos]]
+
+            if rotated[0] == wi:
+                insert = rotated[1:]
+            else:
+                insert = rotated + [wi]
+                addBridge(wi, rotated[0])
+            splices.setdefault(hi, {}).setdefault(wi, []).append(insert)
+
+            lengths[hi] += lengths[li]
+            alive[li] = False
+            paths[li] = None
+            owner[li] = hi
+
+        self.setPaths([spliceLoops(pi) for pi in range(numPaths) if paths[pi] is not None])
+        return numPaths, len(self.pathsById)
+
+    def simplifyPaths(self, tolerance = 0):
+        """ drops exactly collinear vertices from every path, and, if
+        tolerance (in drawing units) is above zero, simplifies them
+        further with Douglas-Peucker. This is meant as a last step
+        before drawing, after all the edges are in.
+
+        returns the number of vertices before and after.
+        """
+        before = 0
+        after = 0
+        simplified = []
+        for p in self.paths:
+            points = [self.vertices[vi] for vi in p]
+            keep = simplify.removeCollinear(points)
+            if tolerance > 0:
+                keep = [keep[i] for i in simplify.douglasPeucker([points[k] for k in keep], tolerance)]
+            simplified.append([p[k] for k in keep])
+            before += len(p)
+            after += len(keep)
+
+        self.setPaths(simplified)
+        return before, after
+
+    def removeOverlaps(self, tolerance = EPSILON):
+        """ breaks every path into its edges, takes out any stretch of
+        an edge that lies on top of another, and welds what's left
+        back into paths. Run mergePaths afterwards, as this can leave
+        more, shorter, paths than before.
+
+        returns the length of ink saved.
+        """
+        segments = []
         for p in self.paths:
+            for i in range(1, len(p)):
+                segments.append((self.vertices[p[i - 1]], self.vertices[p[i]]))
+
+        segments, removed = overlap.removeCollinearOverlaps(segments, tolerance)
+
+        self.clear()
+        for seg in segments:
+            self.addEdge(seg)
+        return removed
+
+    def clear(self):
+        """ empties the pool """
+        self.vertices = []
+        self.pathsById = {}
+        self.pathEnds = {}
+        self.connectedVerts = set()
+        self.vertexGrid = {}
+
+    def getPaths(self):
+        for p in self.pathsById.values():
             yield [self.vertices[i] for i in p]
 
     def getSortedPaths(self):
@@ -107,36 +500,28 @@ class EdgePool:
             yield [self.vertices[i] for i in p]
 
     def getGreedySortedPaths(self, startpoint = None):
+        """ repeatedly picks the path whose nearest end is closest to
+        where the last one finished """
         if startpoint is None:
             startpoint = m.Vector2(0, 0)
 
-        outPaths = []
+        paths = list(self.getPaths())
+        order = pathorder.greedyOrder(paths, startpoint)
+        return pathorder.applyOrder(paths, order)
+
+    def getOptimizedPaths(self, startpoint = None, time_limit = 1.0):
+        """ the greedy order, then refined for up to time_limit seconds
+        (0 skips refining) to cut pen-up travel. Returns (paths,
+        penUpBefore, penUpAfter) where the distances are for the greedy
+        and refined orders. """
+        return pathorder.optimizePathOrder(list(self.getPaths()), startpoint, time_limit)
+
+    def drawPaths(self, dwg, width = 2, color = 'black', startpoint = None, optimize_time = 0):
+        """ appends a drawSvg Path to dwg for each path, in greedy order,
+        refined for optimize_time seconds if that's above zero.
 
-        unusedPaths = self.paths[:]
-
-        while unusedPaths:
-            closestDist = None
-            closestPath = None
-            closestIndex = None
-
-            for pi, p in enumerate(unusedPaths):
-                d = startpoint.subVec2(self.vertices[p[0]]).mag()
-                if closestPath is None or d < closestDist:
-                    closestPath = p
-                    closestIndex = pi
-                    closestDist = d
-                d = startpoint.subVec2(self.vertices[p[-1]]).mag()
-                if d < closestDist:
-                    closestPath = list(reversed(p))
-                    closestIndex = pi
-                    closestDist = d
-            del(unusedPaths[closestIndex])
-            outPaths.append([self.vertices[x] for x in closestPath])
-            startpoint = self.vertices[closestPath[-1]]
-        return outPaths
-
-    def drawPaths(self, dwg, width = 2, color = 'black', startpoint = None):
-        paths = self.getGreedySortedPaths(startpoint)
+        returns the pen-up distance (before, after) refining """
+        paths, before, after = self.getOptimizedPaths(startpoint, optimize_time)
 
         for edge_path in paths:
             p = draw.Path(stroke_width = width, stroke = color, fill='none')
@@ -144,13 +529,130 @@ class EdgePool:
             for v in edge_path[1:]:
                 p.L(*v.components)
             dwg.append(p)
-
-        
-
-            
-            
-                
-            
-
-
-        
+        return before, after
+
+    def writePaths(self, writer, startpoint = None, optimize_time = 0):
+        """ like drawPaths, but sends the paths to a plotwriter writer
+        instead of building a drawSvg Path for each one """
+        paths, before, after = self.getOptimizedPaths(startpoint, optimize_time)
+        writer.writePolylines(paths)
+        return before, after
+
+
+class StreamingEdgePool(EdgePool):
+    """ an EdgePool for edges that arrive roughly in order along one
+    axis, like marching squares working across the grid a column at a
+    time. Paths that can't be extended any more are handed off to a
+    sink, and forgotten, so memory is set by the paths still open at
+    the frontier, not by the size of the whole drawing.
+
+    Call advance(frontier) as the input moves along, promising that
+    no later edge has a vertex below frontier on the sweep axis, then
+    call finish() at the end.
+
+    sink is called with each finished path (a list of Vector2). If
+    there's no sink, finished paths wait in a queue for
+    finishedPaths() to collect them.
+    """
+
+    def __init__(self, sink = None, sweep_axis = 'x'):
+        super().__init__()
+
+        # vertex index -> Vector2, so that vertices can be forgotten
+        self.vertices = {}
+        self.nextVertIndex = 0
+
+        self.sink = sink
+        self.finished = collections.deque()
+
+        if sweep_axis == 'x':
+            self.axisCoord = m.Vector2.x
+        elif sweep_axis == 'y':
+            self.axisCoord = m.Vector2.y
+        else:
+            raise ValueError(f"sweep_axis should be 'x' or 'y', not {sweep_axis}")
+
+    def storeVert(self, v):
+        vi = self.nextVertIndex
+        self.nextVertIndex += 1
+        self.vertices[vi] = v
+        return vi
+
+    def clear(self):
+        """ empties the pool, but not the queue of finished paths """
+        super().clear()
+        self.vertices = {}
+
+    def emit(self, path):
+        pts = [self.vertices[vi] for vi in path]
+        if self.sink is None:
+            self.finished.append(pts)
+        else:
+            self.sink(pts)
+
+    def advance(self, frontier):
+        # nothing that arrives from now on can weld to a vertex this
+        # far behind the frontier
+        threshold = frontier - EPSILON
+        axisCoord = self.axisCoord
+
+        def isBehind(vi):
+            return axisCoord(self.vertices[vi]) < threshold
+
+        for pathId, p in list(self.pathsById.items()):
+            if isBehind(p.first()) and isBehind(p.last()):
+                self.removePath(pathId)
+                self.emit(p)
+
+        # forget vertices behind the frontier, unless an open path
+        # still needs them
+        inUse = set()
+        for p in self.pathsById.values():
+            inUse.update(p)
+
+        for key, cell in list(self.vertexGrid.items()):
+            cell = tuple(vi for vi in cell if not isBehind(vi))
+            if cell:
+                self.vertexGrid[key] = cell
+            else:
+                del self.vertexGrid[key]
+
+        for vi in [vi for vi in self.vertices if isBehind(vi) and vi not in inUse]:
+            del self.vertices[vi]
+
+        self.connectedVerts = {e for e in self.connectedVerts
+                               if e[0] in self.vertices and e[1] in self.vertices}
+
+    def finish(self):
+        """ flushes every path that's left """
+        for pathId in list(self.pathsById.keys()):
+            self.emit(self.removePath(pathId))
+        self.vertices = {}
+        self.vertexGrid = {}
+        self.connectedVerts = set()
+
+    def finishedPaths(self):
+        """ yields (and forgets) the paths finished so far, when there's no sink """
+        while self.finished:
+            yield self.finished.popleft()
+
+
+if __name__ == "__main__":
+    import time
+    import random
+
+    # welding benchmark: the time per vertex should stay flat as the
+    # pool grows
+    random.seed(1)
+    for n in [10000, 20000, 40000, 80000]:
+        verts = [m.Vector2(random.uniform(0, 1000), random.uniform(0, 1000)) for i in range(n)]
+        # revisit every vertex, as joined segments do
+        verts = verts + verts
+
+        ep = EdgePool()
+        startTime = time.perf_counter()
+        for v in verts:
+            ep.insertVert(v)
+        elapsed = time.perf_counter() - startTime
+
+        print(f"{n} vertices: {elapsed:0.3f}s, {1e6 * elapsed / len(verts):0.2f}us per insert")
@@ -1,7 +1,13 @@
+import os
 import math
+import mmap
+import array
 import random
+import struct
 import pathlib
 import inspect
+import tempfile
+import functools
 
 import drawSvg as draw
 import bdgmath as m
@@ -32,58 +38,92 @@ def decodeCoord(c):
     rVal = ord('R')
     return cVal - rVal
 
-def drawHersheyChar(dwg, s, matrix, scale, color='black', stroke_width = 2):
-    p = draw.Path(stroke_width = stroke_width, stroke=color, fill='none')
+# in decoded vertex arrays, a pair of these marks a pen-up
+PEN_UP = -128
 
+def decodeHersheyVertices(s):
+    """ decodes one line of a .jhf file into (left, right, vertices),
+    where vertices is an array('b') of interleaved x, y values, with y
+    flipped so that it points up, and pen-ups marked by a pair of
+    PEN_UP values."""
     numVerts = int(s[5:8])
 
     leftPos = decodeCoord(s[8])
     rightPos = decodeCoord(s[9])
 
-    remainder = s[10:]
-
-    minX = 0
-    maxX = 0
-    minY = 0
-    maxY = 0
-
-    yFlip = True
+    vertices = array.array('b')
 
-    moveFlag = True
     for vi in range(0, numVerts - 1):
         cx = s[10 + 2 * vi]
         cy = s[11 + 2 * vi]
 
         if cx + cy == " R":
-            moveFlag = True
+            vertices.append(PEN_UP)
+            vertices.append(PEN_UP)
             continue
-        
-        xVal = decodeCoord(cx)
-        yVal = decodeCoord(cy)
 
-        if yFlip:
-            yVal = -yVal
+        vertices.append(decodeCoord(cx))
+        vertices.append(-decodeCoord(cy))
 
-        if vi == 0:
-            minX = xVal
-            maxX = xVal
-            minY = yVal
-            maxY = yVal
-        else:
-            minX = min(minX, xVal)
-            maxX = max(maxX, xVal)
-            minY = min(minY, yVal)
-            maxY = max(maxY, yVal)
+    return leftPos, rightPos, vertices
+
+def decodeHersheyStrokes(vertices):
+    """ turns decoded glyph vertices (see decodeHersheyVertices) into
+    (coords, strokeLengths): coords is an array('d') of interleaved x,
+    y values for every pen-down vertex, and strokeLengths gives the
+    number of vertices in each pen-down run, in order."""
+    coords = array.array('d')
+    strokeLengths = []
+
+    moveFlag = True
+    for vi in range(0, len(vertices), 2):
+        xVal = vertices[vi]
+        yVal = vertices[vi + 1]
+
+        if xVal == PEN_UP:
+            moveFlag = True
+            continue
 
-        pt = matrix.mulVec2(m.Vector2(xVal, yVal).mulScalar(scale))
+        coords.append(xVal)
+        coords.append(yVal)
         if moveFlag:
-            p.M(*pt.components)
+            strokeLengths.append(1)
         else:
-            p.L(*pt.components)
+            strokeLengths[-1] += 1
         moveFlag = False
+
+    return coords, strokeLengths
+
+def drawHersheyStrokes(dwg, coords, strokeLengths, matrix, scale, color='black', stroke_width = 2):
+    """ draws decoded strokes (see decodeHersheyStrokes) as a single
+    path, transforming all of them in one pass """
+    p = draw.Path(stroke_width = stroke_width, stroke=color, fill='none')
+
+    scaledMatrix = matrix.mulMat3(m.makeScaleUniform(scale))
+    transformed = scaledMatrix.transformArray(coords)
+
+    vi = 0
+    for n in strokeLengths:
+        p.M(transformed[vi], transformed[vi + 1])
+        for li in range(vi + 2, vi + 2 * n, 2):
+            p.L(transformed[li], transformed[li + 1])
+        vi += 2 * n
     dwg.append(p)
 
-    return (minX * scale, minY * scale, maxX * scale, maxY * scale)
+def drawHersheyGlyph(dwg, vertices, matrix, scale, color='black', stroke_width = 2):
+    """ draws decoded glyph vertices (see decodeHersheyVertices) """
+    coords, strokeLengths = decodeHersheyStrokes(vertices)
+    drawHersheyStrokes(dwg, coords, strokeLengths, matrix, scale, color, stroke_width)
+
+    if not coords:
+        return (0, 0, 0, 0)
+    xs = coords[0::2]
+    ys = coords[1::2]
+    return (min(xs) * scale, min(ys) * scale, max(xs) * scale, max(ys) * scale)
+
+def drawHersheyChar(dwg, s, matrix, scale, color='black', stroke_width = 2):
+    leftPos, rightPos, vertices = decodeHersheyVertices(s)
+    return drawHersheyGlyph(dwg, vertices, matrix, scale, color, stroke_width)
 
 def getHersheyBounds(s):
     numVerts = int(s[5:8])
@@ -129,6 +169,224 @@ def getHersheyBounds(s):
 
 
 
+#--------------------
+# Compiled fonts
+#--------------------
+
+# Parsing the .jhf text on every HersheyFont construction adds up, so
+# each font is compiled once into a small binary file:
+#
+#   header: magic, version, the size and mtime of the .jhf it came
+#           from (so stale files get rebuilt), and the glyph count
+#   glyph table: one fixed-size record per glyph, holding the offset
+#           and count of its vertices, its left and right positions,
+#           and its precomputed bounds
+#   vertex data: int8 x, y pairs, as from decodeHersheyVertices
+#
+# The compiled file is mmapped, so loading is nearly free, and any
+# glyph is found in O(1) without any string parsing.
+
+COMPILED_MAGIC = b'BDGH'
+COMPILED_VERSION = 1
+COMPILED_SUFFIX = ".bhf"
+
+# magic, version, padding, source size, source mtime (ns), glyph count
+COMPILED_HEADER = struct.Struct('<4sHHqqI')
+
+# vertex offset, vertex count, left, right, minX, minY, maxX, maxY
+COMPILED_GLYPH = struct.Struct('<IHbbbbbb')
+
+
+class CompiledHersheyFont:
+    def __init__(self, buf):
+        """ buf is the contents of a compiled font, either bytes or an mmap """
+        self.buf = buf
+
+        (magic, version, padding,
+         self.sourceSize, self.sourceMtimeNs,
+         self.numGlyphs) = COMPILED_HEADER.unpack_from(buf, 0)
+
+        if magic != COMPILED_MAGIC or version != COMPILED_VERSION:
+            raise ValueError("not a compiled Hershey font")
+
+        self.glyphTableStart = COMPILED_HEADER.size
+        vertexStart = self.glyphTableStart + self.numGlyphs * COMPILED_GLYPH.size
+        if vertexStart > len(buf):
+            raise ValueError("compiled Hershey font is truncated")
+
+        # a file cut short, by a crash or a full disk, must not pass
+        # for a good one, so check every glyph's vertices are there
+        with memoryview(buf)[self.glyphTableStart:vertexStart] as glyphTable:
+            numVertices = max((offset + count for offset, count, *rest
+                               in COMPILED_GLYPH.iter_unpack(glyphTable)), default = 0)
+        if len(buf) - vertexStart != 2 * numVertices:
+            raise ValueError("compiled Hershey font is truncated")
+
+        self.vertexData = memoryview(buf)[vertexStart:].cast('b')
+
+    def __len__(self):
+        return self.numGlyphs
+
+    def getRecord(self, glyphIndex):
+        # negative indices count from the end, like the list of lines
+        # this replaces
+        if glyphIndex < 0:
+            glyphIndex += self.numGlyphs
+        if not (0 <= glyphIndex < self.numGlyphs):
+            raise IndexError(f"glyph index {glyphIndex} out of range")
+        return COMPILED_GLYPH.unpack_from(self.buf,
+                                          self.glyphTableStart + glyphIndex * COMPILED_GLYPH.size)
+
+    def getVertices(self, glyphIndex):
+        offset, count = self.getRecord(glyphIndex)[:2]
+        return self.vertexData[2 * offset:2 * (offset + count)]
+
+    def getLeftRight(self, glyphIndex):
+        return self.getRecord(glyphIndex)[2:4]
+
+    def getBounds(self, glyphIndex):
+        return self.getRecord(glyphIndex)[4:8]
+
+    def isCurrent(self, sourceStat):
+        return (self.sourceSize == sourceStat.st_size and
+                self.sourceMtimeNs == sourceStat.st_mtime_ns)
+
+    def close(self):
+        """ lets go of buf, closing it if it's an mmap """
+        self.vertexData.release()
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+
+
+def compileHersheyFile(filename, sourceStat = None):
+    """ returns the compiled form of a .jhf file, as bytes """
+    if sourceStat is None:
+        sourceStat = os.stat(filename)
+
+    with open(filename, "rt") as hf:
+        lines = list(unwrapFile(hf))
+
+    glyphTable = bytearray()
+    vertexData = array.array('b')
+
+    for line in lines:
+        leftPos, rightPos, vertices = decodeHersheyVertices(line)
+        minX, minY, maxX, maxY = getHersheyBounds(line)
+
+        glyphTable += COMPILED_GLYPH.pack(len(vertexData) // 2, len(vertices) // 2,
+                                          leftPos, rightPos,
+                                          minX, minY, maxX, maxY)
+        vertexData.extend(vertices)
+
+    header = COMPILED_HEADER.pack(COMPILED_MAGIC, COMPILED_VERSION, 0,
+                                  sourceStat.st_size, sourceStat.st_mtime_ns,
+                                  len(lines))
+    return header + bytes(glyphTable) + vertexData.tobytes()
+
+
+def compiledCacheDirs(asset_dir):
+    # prefer keeping compiled fonts next to the assets, but that might
+    # not be writable, so fall back to the user's cache directory
+    yield asset_dir / "compiled"
+
+    cacheHome = os.environ.get("XDG_CACHE_HOME")
+    if cacheHome:
+        cacheHome = pathlib.Path(cacheHome)
+    else:
+        cacheHome = pathlib.Path.home() / ".cache"
+    yield cacheHome / "bdgptk" / "hershey"
+
+
+def openCompiledFont(path, sourceStat):
+    """ returns the CompiledHersheyFont at path, or None if it is
+    missing, unreadable, or out of date """
+    try:
+        with open(path, "rb") as cf:
+            mm = mmap.mmap(cf.fileno(), 0, access = mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        font = CompiledHersheyFont(mm)
+    except (ValueError, struct.error):
+        font = None
+
+    if font is None:
+        mm.close()
+        return None
+    if not font.isCurrent(sourceStat):
+        font.close()
+        return None
+    return font
+
+
+def loadCompiledFont(filename):
+    """ loads the compiled form of a .jhf file, compiling it first if
+    there's no up-to-date compiled file in any cache directory """
+    filename = pathlib.Path(filename)
+    sourceStat = os.stat(filename)
+    compiledName = filename.stem + COMPILED_SUFFIX
+
+    cacheDirs = list(compiledCacheDirs(filename.parent))
+
+    for cacheDir in cacheDirs:
+        font = openCompiledFont(cacheDir / compiledName, sourceStat)
+        if font is not None:
+            return font
+
+    compiled = compileHersheyFile(filename, sourceStat)
+
+    for cacheDir in cacheDirs:
+        try:
+            cacheDir.mkdir(parents = True, exist_ok = True)
+            fd, tempName = tempfile.mkstemp(dir = cacheDir, suffix = COMPILED_SUFFIX)
+        except OSError:
+            continue
+
+        try:
+            with os.fdopen(fd, "wb") as tf:
+                tf.write(compiled)
+            # mkstemp makes the file private to us, but the cache
+            # directory may be shared, so let everyone read it
+            os.chmod(tempName, 0o644)
+            os.replace(tempName, cacheDir / compiledName)
+        except OSError:
+            # don't leave a half-written file behind
+            try:
+                os.unlink(tempName)
+            except OSError:
+                pass
+            continue
+
+        font = openCompiledFont(cacheDir / compiledName, sourceStat)
+        if font is not None:
+            return font
+
+    # nowhere to cache it, just use it from memory
+    return CompiledHersheyFont(compiled)
+
+
+class HersheyGlyph:
+    """ one glyph, decoded once and kept around: its pen-down strokes
+    (see decodeHersheyStrokes), unscaled, and its bounds """
+
+    __slots__ = ('coords', 'strokeLengths', 'bounds', 'leftPos', 'rightPos')
+
+    def __init__(self, coords, strokeLengths, bounds, leftPos, rightPos):
+        self.coords = coords
+        self.strokeLengths = strokeLengths
+        self.bounds = bounds
+        self.leftPos = leftPos
+        self.rightPos = rightPos
+
+    def strokes(self):
+        """ yields each pen-down stroke as an array('d') of x, y values """
+        vi = 0
+        for n in self.strokeLengths:
+            yield self.coords[vi:vi + 2 * n]
+            vi += 2 * n
+
+
 class HersheyFont:
     def __init__(self, fontname):
         asset_dir = pathlib.PurePath(inspect.getfile(hersheyassets)).parents[1] / "Assets/Hershey"
@@ -139,17 +397,15 @@ class HersheyFont:
 
         self.name = filename.stem
 
-        self.lines = []
-        self.bounds = {}
-
         self.extraCharSpacing = asset.charSpacing
 
+        # charNum -> HersheyGlyph, filled in as glyphs get used
+        self.glyphCache = {}
+
         self.readFile(filename)
 
     def readFile(self, filename):
-        with open(filename, "rt") as hf:
-            for line in unwrapFile(hf):
-                self.lines.append(line)
+        self.glyphs = loadCompiledFont(filename)
 
     def makeSafeCharNum(self, cn):
         rewrites = {201: 'e',
@@ -159,27 +415,37 @@ class HersheyFont:
             ncn = self.charToCharNum(newChar)
             print(f"rewriting {cn} to {ncn} {rewrites[cn]}")
             return ncn
-        if cn < len(self.lines):
+        if cn < len(self.glyphs):
             return cn
 
         print(f"unexpected char num {cn} : {self.charNumToChar(cn)}")
         return self.charToCharNum('?')
 
-    def getCharBounds(self, charNum):
-        if charNum in self.bounds.keys():
-            return self.bounds[charNum]
+    def getGlyph(self, charNum):
+        """ returns the decoded HersheyGlyph for a (safe) charNum """
+        if charNum < 0:
+            charNum += len(self.glyphs)
+        glyph = self.glyphCache.get(charNum)
+        if glyph is None:
+            coords, strokeLengths = decodeHersheyStrokes(self.glyphs.getVertices(charNum))
+            leftPos, rightPos = self.glyphs.getLeftRight(charNum)
+            glyph = HersheyGlyph(coords, strokeLengths,
+                                 self.glyphs.getBounds(charNum),
+                                 leftPos, rightPos)
+            self.glyphCache[charNum] = glyph
+        return glyph
 
+    def getCharBounds(self, charNum):
         charNum = self.makeSafeCharNum(charNum)
-        b = getHersheyBounds(self.lines[charNum])
-        self.bounds[charNum] = b
-        return b
+        return self.getGlyph(charNum).bounds
 
     def drawChar(self, dwg, charNum, matrix, scale, color='black', stroke_width = 2):
         charNum = self.makeSafeCharNum(charNum)
-        drawHersheyChar(dwg, self.lines[charNum], matrix, scale, color, stroke_width)
+        glyph = self.getGlyph(charNum)
+        drawHersheyStrokes(dwg, glyph.coords, glyph.strokeLengths, matrix, scale, color, stroke_width)
 
     def charRange(self):
-        return range(0, len(self.lines))
+        return range(0, len(self.glyphs))
 
     def charToCharNum(self, c):
         c = ord(c)
@@ -196,27 +462,103 @@ class HersheyFont:
         return sum([self.getCharWidth(c, scale) + self.extraCharSpacing * scale for c in s])
 
     def genLines(self, s, scale, lineLength):
-        working = ""
-        for w in s.split():
+        for line, width in self.layoutLines(s, scale, lineLength):
+            yield line
+
+    def layoutLines(self, s, scale, lineLength, optimal = False):
+        """ breaks s into lines no wider than lineLength (except for
+        single words that are too wide on their own), returning a list
+        of (line, width) tuples.
+
+        String widths add up character by character, so each word is
+        measured once, and lines are measured with running sums.
+
+        By default, lines are filled greedily. With optimal set, the
+        breaks are chosen to minimize the total squared slack of every
+        line but the last, in the style of Knuth and Plass, which
+        gives more even right edges.
+        """
+        words = s.split()
+        wordWidths = {}
+        for w in words:
+            if w not in wordWidths:
+                wordWidths[w] = self.getStringWidth(w, scale)
+        widths = [wordWidths[w] for w in words]
+        spaceWidth = self.getStringWidth(" ", scale)
+
+        if optimal:
+            breaks = self.findOptimalBreaks(widths, spaceWidth, lineLength)
+            lines = []
+            for start, end in breaks:
+                width = sum(widths[start:end]) + spaceWidth * max(end - start - 1, 0)
+                lines.append((" ".join(words[start:end]), width))
+            return lines
+
+        lines = []
+        working = []
+        workingWidth = 0
+        for w, wordWidth in zip(words, widths):
+            if working and workingWidth + spaceWidth + wordWidth > lineLength:
+                # adding this word would make the line too long. A word
+                # too long for any line ends up on a line by itself,
+                # since the next word won't fit after it either
+                lines.append((" ".join(working), workingWidth))
+                working = []
+
             if working:
-                newWorking = working + " " + w
+                working.append(w)
+                workingWidth += spaceWidth + wordWidth
             else:
-                newWorking = w
-            workingLineLength = self.getStringWidth(newWorking, scale)
-            
-            if workingLineLength > lineLength:
-                # adding this line would make the line too long
-                yield working
-
-                # this WORD is too long, just output it on a line by itself
-                if self.getStringWidth(w, scale) > lineLength:
-                    yield w
-                    working = ""
+                working = [w]
+                workingWidth = wordWidth
+
+        if working or not lines:
+            lines.append((" ".join(working), workingWidth))
+        return lines
+
+    def findOptimalBreaks(self, widths, spaceWidth, lineLength):
+        """ returns a list of (start, end) word index ranges, one per
+        line, minimizing the sum of squared slack over all but the
+        last line """
+        numWords = len(widths)
+        if numWords == 0:
+            return [(0, 0)]
+
+        # bestCost[j] is the cost of the best layout of words[:j], and
+        # bestStart[j] is where its last line starts
+        bestCost = [0.0] + [math.inf] * numWords
+        bestStart = [0] * (numWords + 1)
+
+        for start in range(numWords):
+            if bestCost[start] == math.inf:
+                continue
+            lineWidth = -spaceWidth
+            for end in range(start + 1, numWords + 1):
+                lineWidth += spaceWidth + widths[end - 1]
+                if lineWidth > lineLength and end > start + 1:
+                    # no longer lines can fit
+                    break
+
+                if end == numWords or lineWidth > lineLength:
+                    # the last line, or a word too long for any line,
+                    # costs nothing
+                    cost = bestCost[start]
                 else:
-                    working = w
-            else:
-                working = newWorking
-        yield working
+                    slack = lineLength - lineWidth
+                    cost = bestCost[start] + slack * slack
+
+                if cost < bestCost[end]:
+                    bestCost[end] = cost
+                    bestStart[end] = start
+
+        breaks = []
+        end = numWords
+        while end > 0:
+            start = bestStart[end]
+            breaks.append((start, end))
+            end = start
+        breaks.reverse()
+        return breaks
 
     def drawCenteredString(self, dwg, s, pos, rot_deg, scale, color = 'black'):
         stringWidth = self.getStringWidth(s, scale)
@@ -227,9 +569,6 @@ class HersheyFont:
         self.drawString(dwg, s, leftPos, rot_deg, scale, color = color)
     
     def drawString(self, dwg, s, pos, rot_deg, scale, color = 'black', stroke_width = 2, max_width = None):
-
-        rotMat = m.makeRotationMat3Degrees(rot_deg)
-            
         if not (max_width is None):
             sw = self.getStringWidth(s, scale)
             if sw == 0:
@@ -239,35 +578,95 @@ class HersheyFont:
                 print(f"old scale: {scale}")
                 scale = scale * max_width / sw
                 print(f"new scale: {scale}")
-        while s:
-            c = s[0]
-            s = s[1:]
 
+        coords, strokeLengths = self.getStringStrokes(s)
+        if not strokeLengths:
+            return
+
+        # one transform for the whole string, rather than one per character
+        mat = m.makeTranslationRotationScaleUniform(pos.x(), pos.y(),
+                                                    math.radians(rot_deg),
+                                                    1)
+        drawHersheyStrokes(dwg, coords, strokeLengths, mat, scale, color, stroke_width)
+
+    def stringToPolylines(self, s, pos, rot_deg, scale, asArrays = False):
+        """ returns the strokes of s, placed as drawString would place
+        them, as plain polylines (lists of Vector2), or as
+        Vector2Arrays if asArrays is set. These can go into an
+        EdgePool, be clipped or transformed, or be sent between
+        processes, none of which a drawSvg Path allows. """
+        coords, strokeLengths = self.getStringStrokes(s)
+
+        mat = m.makeTranslationRotationScaleUniform(pos.x(), pos.y(),
+                                                    math.radians(rot_deg),
+                                                    scale)
+        transformed = mat.transformArray(coords)
+
+        polylines = []
+        vi = 0
+        for n in strokeLengths:
+            stroke = m.Vector2Array(transformed[vi:vi + 2 * n])
+            if asArrays:
+                polylines.append(stroke)
+            else:
+                polylines.append(stroke.toVec2List())
+            vi += 2 * n
+        return polylines
+
+    def stringsToPolylines(self, placements, asArrays = False):
+        """ placements is a list of (s, pos, rot_deg, scale) tuples,
+        returns the polylines of all of them, in one list """
+        polylines = []
+        for s, pos, rot_deg, scale in placements:
+            polylines.extend(self.stringToPolylines(s, pos, rot_deg, scale, asArrays))
+        return polylines
+
+    def getStringStrokes(self, s):
+        """ lays out s along the x axis, starting at the origin, in
+        unscaled font units, and returns (coords, strokeLengths) for
+        the whole string, as decodeHersheyStrokes does for one glyph """
+        coords = array.array('d')
+        strokeLengths = []
+
+        penX = 0
+        for c in s:
             charNum = self.charToCharNum(c)
             charNum = self.makeSafeCharNum(charNum)
 
             if ((charNum >= 0) and
-                (charNum < len(self.lines))):
-
-                xMin, yMin, xMax, yMax = self.getCharBounds(charNum)
-                charAdv = rotMat.mulVec2(m.Vector2(-xMin * scale, 0))
-                charPos = pos.addVec2(charAdv)
-                mat = m.makeTranslationRotationScaleUniform(charPos.x(), charPos.y(),
-                                                            math.radians(rot_deg),
-                                                            1)
-                
-                self.drawChar(dwg, charNum, mat, scale, color, stroke_width)
+                (charNum < len(self.glyphs))):
+
+                glyph = self.getGlyph(charNum)
+                xMin, yMin, xMax, yMax = glyph.bounds
+
+                glyphCoords = array.array('d', glyph.coords)
+                offset = penX - xMin
+                glyphCoords[0::2] = array.array('d', [x + offset for x in glyph.coords[0::2]])
+                coords.extend(glyphCoords)
+                strokeLengths.extend(glyph.strokeLengths)
+
                 advanceValue = xMax - xMin + self.extraCharSpacing
             else:
                 advanceValue = 10 + self.extraCharSpacing
-            pos = pos.addVec2(rotMat.mulVec2(m.Vector2(advanceValue, 0).mulScalar(scale)))
+            penX += advanceValue
 
-    def drawWrappedString(self, dwg, s, left, right, first, scale, lineAdvance):
-        print(f"drawing wrapped string at scale {scale}")
+        return coords, strokeLengths
+
+    def drawWrappedString(self, dwg, s, left, right, first, scale, lineAdvance, optimal = False):
         pos = m.Vector2(left, first)
-        for line in self.genLines(s, scale, right - left):
-            self.drawString(dwg, line, pos, scale)
+        for line, width in self.layoutLines(s, scale, right - left, optimal):
+            self.drawString(dwg, line, pos, 0, scale)
             pos = pos.addVec2(m.Vector2(0, -lineAdvance))
             
         
         
+
+
+def getFont(fontname):
+    """ returns a shared HersheyFont, so that asking for the same font
+    over and over (say, inside a loop) only loads it once """
+    return getFontForAsset(hersheyassets.findByName(fontname).name)
+
+@functools.lru_cache(maxsize = 32)
+def getFontForAsset(assetName):
+    return HersheyFont(assetName)
@@ -43,13 +43,28 @@ assets = [
     HersheyAsset("timesrb", 4),
     ]
 
+# built once, so lookups by exact name don't scan the list
+assetIndex = {a.name: a for a in assets}
+
+def findAllByName(name):
+    """ returns every asset matching name: an exact match if there is
+    one, otherwise the assets whose names start with name, otherwise
+    the assets whose names contain name """
+    if name in assetIndex:
+        return [assetIndex[name]]
+
+    hits = [a for a in assets if a.name.startswith(name)]
+    if hits:
+        return hits
+
+    return [a for a in assets if name in a.name]
+
 def findByName(name):
-    for a in assets:
-        if a.name == name:
-            return a
-
-    hits = []
-    for a in assets:
-        if a in name:
-            hits.append(a)
-    return hits
+    """ returns the one asset matching name, raising a KeyError if
+    there is no match, or if the match is ambiguous """
+    hits = findAllByName(name)
+    if len(hits) == 1:
+        return hits[0]
+    if not hits:
+        raise KeyError(f"no Hershey font matches {name}")
+    raise KeyError(f"{name} could be any of " + ", ".join(a.name for a in hits))
@@ -0,0 +1,264 @@
+import math
+import random
+import time
+
+import bdgmath as m
+
+# Finding every crossing in a drawing by testing each pair of segments
+# with bdgmath.intersectSegments is O(n^2), which is hopeless on real
+# plots. Instead, walk each segment through the cells of a uniform grid
+# that it actually crosses, and only test pairs that share a cell.
+#
+# A pair of segments can share more than one cell, so each pair is
+# only tested, and reported, once.
+
+
+def chooseCellSize(segments):
+    """ picks a cell size that puts a handful of segments in each cell,
+    if the ink were spread evenly over the drawing's bounds, but no
+    more than a few typical (median) segments across, so that a few
+    long segments can't blow it up """
+    extents = []
+    totalLength = 0.0
+    minX = minY = math.inf
+    maxX = maxY = -math.inf
+    for v0, v1 in segments:
+        x0, y0 = v0.components
+        x1, y1 = v1.components
+        extents.append(max(abs(x1 - x0), abs(y1 - y0)))
+        totalLength += math.hypot(x1 - x0, y1 - y0)
+        minX = min(minX, x0, x1)
+        minY = min(minY, y0, y1)
+        maxX = max(maxX, x0, x1)
+        maxY = max(maxY, y0, y1)
+    if not segments or totalLength == 0:
+        return 1.0
+
+    extents.sort()
+    typical = extents[len(extents) // 2]
+
+    # a cell of size c holds about totalLength * c / area segments
+    area = max(maxX - minX, 1e-9) * max(maxY - minY, 1e-9)
+    cellSize = 16 * area / totalLength
+    if typical > 0:
+        cellSize = min(cellSize, 4 * typical)
+
+    # but never so small that a segment crosses an absurd number of
+    # cells
+    return max(cellSize, max(maxX - minX, maxY - minY) / 4096, 1e-9)
+
+
+def cellsOnSegment(x0, y0, x1, y1, invCell):
+    """ the grid cells that the segment from (x0, y0) to (x1, y1)
+    passes through. The segment is walked a column (or, if it's
+    steeper, a row) at a time, taking the span of cells it covers
+    across each one. A segment passing exactly through a corner gets
+    the cells on both sides of it. """
+    gx0 = x0 * invCell
+    gy0 = y0 * invCell
+    gx1 = x1 * invCell
+    gy1 = y1 * invCell
+
+    cx0 = math.floor(gx0)
+    cy0 = math.floor(gy0)
+    cx1 = math.floor(gx1)
+    cy1 = math.floor(gy1)
+    if cx0 == cx1:
+        if cy0 == cy1:
+            return [(cx0, cy0)]
+        return [(cx0, cy) for cy in range(min(cy0, cy1), max(cy0, cy1) + 1)]
+    if cy0 == cy1:
+        return [(cx, cy0) for cx in range(min(cx0, cx1), max(cx0, cx1) + 1)]
+
+    steep = abs(gy1 - gy0) > abs(gx1 - gx0)
+    if steep:
+        # walk rows instead, with x and y swapped
+        gx0, gy0, gx1, gy1 = gy0, gx0, gy1, gx1
+        cx0, cy0, cx1, cy1 = cy0, cx0, cy1, cx1
+    if gx1 < gx0:
+        gx0, gy0, gx1, gy1 = gx1, gy1, gx0, gy0
+        cx0, cy0, cx1, cy1 = cx1, cy1, cx0, cy0
+
+    slope = (gy1 - gy0) / (gx1 - gx0)
+    cells = []
+    rowIn = cy0
+    for cx in range(cx0, cx1 + 1):
+        if cx == cx1:
+            yOut = gy1
+        else:
+            yOut = gy0 + (cx + 1 - gx0) * slope
+        rowOut = math.floor(yOut)
+        if rowIn <= rowOut:
+            rows = range(rowIn, rowOut + 1)
+        else:
+            rows = range(rowOut, rowIn + 1)
+        if steep:
+            cells.extend([(cy, cx) for cy in rows])
+        else:
+            cells.extend([(cx, cy) for cy in rows])
+        rowIn = rowOut
+    return cells
+
+
+def intersectSegmentPair(p0x, p0y, p1x, p1y, q0x, q0y, q1x, q1y):
+    """ the same math as bdgmath.intersectSegments, on plain floats.
+
+    returns (x, y, colinear, t, u), or None if the segments don't
+    touch. Unlike intersectSegments, colinear segments are only
+    reported if they overlap by more than a point, and then (x, y) is
+    where the overlap starts.
+    """
+    rx = p1x - p0x
+    ry = p1y - p0y
+    sx = q1x - q0x
+    sy = q1y - q0y
+
+    qpx = q0x - p0x
+    qpy = q0y - p0y
+
+    rCrossS = rx * sy - ry * sx
+
+    if rCrossS == 0:
+        if qpx * ry - qpy * rx != 0:
+            # parallel and non-intersecting
+            return None
+
+        # colinear, check that the segments overlap along r
+        rr = rx * rx + ry * ry
+        if rr == 0:
+            return None
+        t0 = (qpx * rx + qpy * ry) / rr
+        t1 = t0 + (sx * rx + sy * ry) / rr
+        lo = max(min(t0, t1), 0.0)
+        hi = min(max(t0, t1), 1.0)
+        if hi <= lo:
+            # apart, or only touching end to end
+            return None
+        return (p0x + rx * lo, p0y + ry * lo, True, 0, 0)
+
+    u = (qpx * ry - qpy * rx) / rCrossS
+    t = (qpx * sy - qpy * sx) / rCrossS
+
+    if ((0.0 <= u) and (u < 1.0) and
+        (0.0 <= t) and (t < 1.0)):
+        return (q0x + sx * u, q0y + sy * u, False, t, u)
+    return None
+
+
+def intersectAllSegments(segments, cellSize = None):
+    """ segments is a list of (Vector2, Vector2) tuples.
+
+    returns a list of (i, j, point, colinear, t, u) for every pair of
+    segments i < j that intersect, where point, colinear, t and u
+    have the same meaning as in bdgmath.intersectSegments (t is the
+    parameter along segment i, u along segment j).
+    """
+    if cellSize is None:
+        cellSize = chooseCellSize(segments)
+    invCell = 1.0 / cellSize
+
+    coords = []
+    boxes = []
+    grid = {}
+
+    for si, (v0, v1) in enumerate(segments):
+        x0, y0 = v0.components
+        x1, y1 = v1.components
+        coords.append((x0, y0, x1, y1))
+        boxes.append((min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))
+
+        for key in cellsOnSegment(x0, y0, x1, y1, invCell):
+            if key in grid:
+                grid[key].append(si)
+            else:
+                grid[key] = [si]
+
+    hits = []
+    tested = set()
+
+    for cell in grid.values():
+        numInCell = len(cell)
+        for a in range(numInCell):
+            i = cell[a]
+            aMinX, aMinY, aMaxX, aMaxY = boxes[i]
+            for b in range(a + 1, numInCell):
+                j = cell[b]
+                bMinX, bMinY, bMaxX, bMaxY = boxes[j]
+
+                # bounding boxes must overlap
+                if (aMaxX < bMinX or bMaxX < aMinX or
+                    aMaxY < bMinY or bMaxY < aMinY):
+                    continue
+
+                # pairs that share several cells are only tested once
+                pair = (i, j) if i < j else (j, i)
+                if pair in tested:
+                    continue
+                tested.add(pair)
+
+                lo, hi = pair
+                hit = intersectSegmentPair(*coords[lo], *coords[hi])
+                if hit is not None:
+                    x, y, colinear, t, u = hit
+                    hits.append((lo, hi, m.Vector2(x, y), colinear, t, u))
+
+    hits.sort(key = lambda h: (h[0], h[1]))
+    return hits
+
+
+def intersectAllPaths(paths, cellSize = None):
+    """ paths is a list of polylines (lists of Vector2).
+
+    returns the same records as intersectAllSegments, except that
+    each segment index is a (pathIndex, segmentIndex) tuple. Adjacent
+    segments of one path are only reported if they run back over each
+    other, not for the vertex they share.
+    """
+    segments = []
+    indices = []
+    for pi, p in enumerate(paths):
+        for vi in range(1, len(p)):
+            segments.append((p[vi - 1], p[vi]))
+            indices.append((pi, vi - 1))
+
+    def adjacent(a, b):
+        (pa, sa), (pb, sb) = a, b
+        if pa != pb:
+            return False
+        if abs(sa - sb) == 1:
+            return True
+        # the first and last segments of a closed path
+        p = paths[pa]
+        return (abs(sa - sb) == len(p) - 2 and len(p) > 3 and
+                p[0].x() == p[-1].x() and p[0].y() == p[-1].y())
+
+    return [(indices[i], indices[j], pt, colinear, t, u)
+            for i, j, pt, colinear, t, u in intersectAllSegments(segments, cellSize)
+            if colinear or not adjacent(indices[i], indices[j])]
+
+
+def makeRandomSegments(n, size, maxLength):
+    segments = []
+    for i in range(n):
+        x = random.uniform(0, size)
+        y = random.uniform(0, size)
+        theta = random.uniform(0, 2 * math.pi)
+        length = random.uniform(0, maxLength)
+        v0 = m.Vector2(x, y)
+        segments.append((v0, v0.addVec2(m.makeUnitVec2FromAngle(theta).mulScalar(length))))
+    return segments
+
+
+if __name__ == "__main__":
+    random.seed(1)
+
+    for n in [10000, 100000]:
+        # keep the density of the drawing constant as n grows
+        size = 10 * math.sqrt(n)
+        segments = makeRandomSegments(n, size, 20)
+
+        startTime = time.perf_counter()
+        hits = intersectAllSegments(segments)
+        elapsed = time.perf_counter() - startTime
+
+        print(f"{n} segments: {len(hits)} intersections in {elapsed:0.2f}s")
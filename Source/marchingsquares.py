@@ -1,17 +1,29 @@
 import math
 import drawSvg as draw
+import numpy as np
 
 import bdgmath as m
+import edgepool
 
 
 class SampleGrid:
-    def __init__(self, minX, minY, maxX, maxY, step_size, sample_func):
+    def __init__(self, minX, minY, maxX, maxY, step_size, sample_func, vectorized = False):
+        """
+        sample_func = either a function of one Vector2, or, if
+            vectorized is set, a function of two numpy arrays, xs and
+            ys, that returns an array of the same shape, with a sample
+            for each (xs[i, j], ys[i, j]). Anything that broadcasts to
+            that shape, like a single number, is fine too. Note that
+            xs and ys are indexed [x, y], so on a square grid an
+            answer indexed [y, x] can't be caught.
+        """
         self.minX = minX
         self.minY = minY
         self.maxX = maxX
         self.maxY = maxY
         self.stepSize = step_size
         self.sample_func = sample_func
+        self.vectorized = vectorized
         self.maxDist = 0
         self.sample()
 
@@ -20,92 +32,205 @@ class SampleGrid:
         y = sy * self.stepSize + self.minY
         return m.Vector2(x, y)
 
+    def countSteps(self, minVal, maxVal):
+        """ how many samples fit from minVal to maxVal, inclusive """
+        n = max(0, math.floor((maxVal - minVal) / self.stepSize) + 1)
+        # make sure rounding agrees with computing each position
+        while n * self.stepSize + minVal <= maxVal:
+            n += 1
+        while n > 0 and (n - 1) * self.stepSize + minVal > maxVal:
+            n -= 1
+        return n
+
     def sample(self):
-        self.samples = {}
-        sx = 0
-        x = sx * self.stepSize + self.minX
-        while x <= self.maxX:
-            sy = 0
-            y = sy * self.stepSize + self.minY
-            while y <= self.maxY:
-                dist = self.sample_func(m.Vector2(x,y))
-                self.samples[(sx, sy)] = dist
-
-                self.maxDist = max(self.maxDist, dist)
-    
-                sy += 1
-                y = sy * self.stepSize + self.minY
-            sx += 1
-            x = sx * self.stepSize + self.minX
+        """ fills samples, a 2d array of floats indexed [sx, sy] """
+        numX = self.countSteps(self.minX, self.maxX)
+        numY = self.countSteps(self.minY, self.maxY)
+
+        # world positions of each column and row
+        self.xs = np.arange(numX) * self.stepSize + self.minX
+        self.ys = np.arange(numY) * self.stepSize + self.minY
+
+        if self.vectorized:
+            gridXs, gridYs = np.meshgrid(self.xs, self.ys, indexing = 'ij')
+            samples = np.asarray(self.sample_func(gridXs, gridYs), dtype = float)
+            if samples.shape != (numX, numY):
+                try:
+                    samples = np.array(np.broadcast_to(samples, (numX, numY)))
+                except ValueError:
+                    raise ValueError(f"sample_func gave samples of shape {samples.shape}, "
+                                     f"but the grid needs ({numX}, {numY}), indexed [x, y] "
+                                     f"like the xs and ys it was given") from None
+            self.samples = samples
+        else:
+            self.samples = np.empty((numX, numY))
+            for sx, x in enumerate(self.xs.tolist()):
+                for sy, y in enumerate(self.ys.tolist()):
+                    self.samples[sx, sy] = self.sample_func(m.Vector2(x, y))
+
+        if self.samples.size:
+            self.maxDist = max(self.maxDist, float(self.samples.max()))
 
         #print(f"max sampled dist: {self.maxDist}")
-            
-    
-def drawMarchingSquares(sg, ep, d):
-    keys = list(sg.samples.keys())
-    keys.sort()
-                
-    for sx, sy in keys:
-        sx1 = sx + 1
-        sy1 = sy + 1
-        if not ((sx1, sy1) in sg.samples):
-            continue
-
-        ll = sg.samples[(sx, sy)]
-        lr = sg.samples[(sx1, sy)]
-        ul = sg.samples[(sx, sy1)]
-        ur = sg.samples[(sx1, sy1)]
-
-        vals = [ll, lr, ul, ur]
-        if (all([v > d for v in vals]) or
-            all([v < d for v in vals])):
-            continue
-
-        #print(f"found crossing {ll} {lr} {ul} {ur}")
-
-        crossings = []
-
-        llx, lly = sg.samplePtToWorldPt(sx, sy).components
-        lrx, lry = sg.samplePtToWorldPt(sx1, sy).components
-        ulx, uly = sg.samplePtToWorldPt(sx, sy1).components
-        urx, ury = sg.samplePtToWorldPt(sx1, sy1).components
-
-        if ((ll < d and lr < d) or
-            (ll > d and lr > d)):
-            pass
-        else:
-            crossX = m.mapVal(d, ll, lr, llx, lrx)
-            crossY = lly
-            crossings.append(m.Vector2(crossX, crossY))
 
-        if ((ll < d and ul < d) or
-            (ll > d and ul > d)):
-            pass
-        else:
-            crossY = m.mapVal(d, ll, ul, lly, uly)
-            crossX = llx
-            crossings.append(m.Vector2(crossX, crossY))
-        
-        if ((ul < d and ur < d) or
-            (ul > d and ur > d)):
-            pass
-        else:
-            crossX = m.mapVal(d, ul, ur, ulx, urx)
-            crossY = uly
-            crossings.append(m.Vector2(crossX, crossY))
 
-        if ((lr < d and ur < d) or
-            (lr > d and ur > d)):
-            pass
-        else:
-            crossY = m.mapVal(d, lr, ur, lry, ury)
-            crossX = lrx
-            crossings.append(m.Vector2(crossX, crossY))
-
-        if len(crossings) == 4:
-            ep.addEdge((crossings[2], crossings[3]))            
-        if len(crossings) >= 2:
-            ep.addEdge((crossings[0], crossings[1]))
-            
-        
-            
+# cell corners are numbered like bits of the case index:
+# ll = 1, lr = 2, ul = 4, ur = 8, set where the sample is above the
+# contour value. Cell sides are numbered bottom = 0, left = 1, top = 2,
+# right = 3, and each case lists the pairs of sides its segments join,
+# in the order the old per-cell loop found them.
+BOTTOM, LEFT, TOP, RIGHT = range(4)
+
+SEGMENT_TABLE = [
+    (),                                 # 0: all below
+    ((BOTTOM, LEFT),),                  # 1: ll
+    ((BOTTOM, RIGHT),),                 # 2: lr
+    ((LEFT, RIGHT),),                   # 3: ll lr
+    ((LEFT, TOP),),                     # 4: ul
+    ((BOTTOM, TOP),),                   # 5: ll ul
+    ((TOP, RIGHT), (BOTTOM, LEFT)),     # 6: lr ul, a saddle
+    ((TOP, RIGHT),),                    # 7: ll lr ul
+    ((TOP, RIGHT),),                    # 8: ur
+    ((TOP, RIGHT), (BOTTOM, LEFT)),     # 9: ll ur, a saddle
+    ((BOTTOM, TOP),),                   # 10: lr ur
+    ((LEFT, TOP),),                     # 11: ll lr ur
+    ((LEFT, RIGHT),),                   # 12: ul ur
+    ((BOTTOM, RIGHT),),                 # 13: ll ul ur
+    ((BOTTOM, LEFT),),                  # 14: lr ul ur
+    (),                                 # 15: all above
+]
+
+# a saddle's segments can cut off either pair of opposite corners. The
+# table cuts off ll and ur; if the middle of the cell is on ll's side
+# of the contour, it's ll and ur that should be joined, so cut off lr
+# and ul instead.
+SADDLE_JOINED = ((BOTTOM, RIGHT), (LEFT, TOP))
+
+
+def marchingSquaresSegments(sg, d):
+    """ finds every segment of the contour at value d through sg's
+    samples, classifying all the cells at once.
+
+    returns (coords, columns): coords is an (n, 4) array of segments,
+    (x0, y0, x1, y1), in column order, and columns is the sx of the
+    cell each came from.
+    """
+    s = sg.samples
+    numX, numY = s.shape
+    if numX < 2 or numY < 2:
+        return np.empty((0, 4)), np.empty(0, dtype = int)
+
+    above = s > d
+    cases = (above[:-1, :-1] * 1 + above[1:, :-1] * 2 +
+             above[:-1, 1:] * 4 + above[1:, 1:] * 8)
+
+    # build the table as arrays: the first and second segment of each
+    # case, as a side pair, with -1 for none
+    firstA = np.full(16, -1)
+    firstB = np.full(16, -1)
+    secondA = np.full(16, -1)
+    secondB = np.full(16, -1)
+    for case, segs in enumerate(SEGMENT_TABLE):
+        if len(segs) > 0:
+            firstA[case], firstB[case] = segs[0]
+        if len(segs) > 1:
+            secondA[case], secondB[case] = segs[1]
+
+    flatCases = cases.ravel()
+    cells = np.nonzero(firstA[flatCases] >= 0)[0]
+    cellCases = flatCases[cells]
+    cellSx, cellSy = np.divmod(cells, numY - 1)
+
+    sideA = firstA[cellCases]
+    sideB = firstB[cellCases]
+    side2A = secondA[cellCases]
+    side2B = secondB[cellCases]
+
+    # resolve saddles by the average of the corners
+    saddles = np.nonzero(side2A >= 0)[0]
+    if len(saddles):
+        ssx = cellSx[saddles]
+        ssy = cellSy[saddles]
+        center = (s[ssx, ssy] + s[ssx + 1, ssy] + s[ssx, ssy + 1] + s[ssx + 1, ssy + 1]) / 4
+        joined = saddles[(center > d) == above[ssx, ssy]]
+        sideA[joined], sideB[joined] = SADDLE_JOINED[0]
+        side2A[joined], side2B[joined] = SADDLE_JOINED[1]
+
+    # every cell's crossing on each of its sides, interpolated the way
+    # mapVal does it. Sides that aren't crossed come out as garbage
+    # (or nan), but never get picked.
+    x0 = sg.xs[cellSx]
+    x1 = sg.xs[cellSx + 1]
+    y0 = sg.ys[cellSy]
+    y1 = sg.ys[cellSy + 1]
+    ll = s[cellSx, cellSy]
+    lr = s[cellSx + 1, cellSy]
+    ul = s[cellSx, cellSy + 1]
+    ur = s[cellSx + 1, cellSy + 1]
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        sideXs = np.stack([(d - ll) / (lr - ll) * (x1 - x0) + x0,
+                           x0,
+                           (d - ul) / (ur - ul) * (x1 - x0) + x0,
+                           x1])
+        sideYs = np.stack([y0,
+                           (d - ll) / (ul - ll) * (y1 - y0) + y0,
+                           y1,
+                           (d - lr) / (ur - lr) * (y1 - y0) + y0])
+
+    n = len(cells)
+    index = np.arange(n)
+    first = np.stack([sideXs[sideA, index], sideYs[sideA, index],
+                      sideXs[sideB, index], sideYs[sideB, index]], axis = 1)
+
+    if not len(saddles):
+        return first, cellSx
+
+    second = np.stack([sideXs[side2A[saddles], saddles], sideYs[side2A[saddles], saddles],
+                       sideXs[side2B[saddles], saddles], sideYs[side2B[saddles], saddles]], axis = 1)
+
+    # a saddle's second segment goes right after its first
+    coords = np.concatenate([first, second])
+    order = np.argsort(np.concatenate([index * 2, saddles * 2 + 1]), kind = 'stable')
+    columns = np.concatenate([cellSx, cellSx[saddles]])
+    return coords[order], columns[order]
+
+
+def drawMarchingSquares(sg, ep, d):
+    coords, columns = marchingSquaresSegments(sg, d)
+    numX = sg.samples.shape[0]
+
+    if not isinstance(ep, edgepool.StreamingEdgePool):
+        for x0, y0, x1, y1 in coords.tolist():
+            ep.addEdge((m.Vector2(x0, y0), m.Vector2(x1, y1)))
+        return
+
+    # where each column's segments start
+    starts = np.searchsorted(columns, np.arange(numX)).tolist()
+    coordList = coords.tolist()
+    for sx in range(numX - 1):
+        # columns go by in order, so everything left of this one is done
+        ep.advance(float(sg.xs[sx]))
+        for x0, y0, x1, y1 in coordList[starts[sx]:starts[sx + 1]]:
+            ep.addEdge((m.Vector2(x0, y0), m.Vector2(x1, y1)))
+
+if __name__ == "__main__":
+    import time
+
+    def wavesAt(p):
+        return math.sin(p.x() * 0.05) * math.cos(p.y() * 0.07)
+
+    def wavesArray(xs, ys):
+        return np.sin(xs * 0.05) * np.cos(ys * 0.07)
+
+    for name, func, vectorized in [("per point", wavesAt, False),
+                                   ("vectorized", wavesArray, True)]:
+        startTime = time.perf_counter()
+        sg = SampleGrid(0, 0, 1000, 1000, 1, func, vectorized)
+        elapsed = time.perf_counter() - startTime
+        print(f"{name}: sampled {sg.samples.size} points in {elapsed:0.2f}s")
+
+    startTime = time.perf_counter()
+    coords, columns = marchingSquaresSegments(sg, 0.5)
+    elapsed = time.perf_counter() - startTime
+    print(f"found {len(coords)} contour segments in {elapsed:0.3f}s")
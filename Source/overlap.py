@@ -0,0 +1,175 @@
+import math
+
+import bdgmath as m
+
+# Layered drawings often put segments on top of each other: grid
+# lines, shared hex edges, borders between SDF shapes. A plotter will
+# happily draw them twice, which wastes time and can soak through
+# thin paper.
+#
+# Segments are grouped by the line they lie on (its angle, and its
+# signed distance from the origin), by sorting, so the whole thing is
+# O(n log n) unless lots of segments crowd within tolerance of each
+# other. Each group is measured from its first segment, and a segment
+# only joins a line if both its ends are within tolerance of it, so
+# nearby lines don't chain together or get pulled off course.
+#
+# Within a line, the segments become intervals along it, and
+# overlapping intervals are merged. The merged intervals are split at
+# every original endpoint, so that other segments that connected
+# there still connect.
+
+
+def lineParams(v0, v1, angleTolerance):
+    """ returns (theta, rho, ux, uy) for the line through v0 and v1,
+    where theta is the angle of the line, rho its signed distance from
+    the origin, and (ux, uy) its unit direction, or None if the
+    segment has no length """
+    dx = v1.x() - v0.x()
+    dy = v1.y() - v0.y()
+    length = math.hypot(dx, dy)
+    if length == 0:
+        return None
+
+    ux = dx / length
+    uy = dy / length
+    theta = math.atan2(uy, ux)
+
+    # lines don't have a direction, so fold theta into
+    # [-angleTolerance, pi - angleTolerance), keeping nearly
+    # horizontal lines together
+    if theta < -angleTolerance:
+        theta += math.pi
+        ux = -ux
+        uy = -uy
+    elif theta >= math.pi - angleTolerance:
+        theta -= math.pi
+        ux = -ux
+        uy = -uy
+
+    rho = v0.y() * ux - v0.x() * uy
+    return theta, rho, ux, uy
+
+
+def clusterSorted(items, key, tolerance):
+    """ splits a list, sorted by key, into runs where each item is
+    within tolerance of the first one in its run. Measuring from the
+    first, not the one before, keeps a row of closely spaced lines
+    from chaining together into one. """
+    clusters = []
+    for item in items:
+        if clusters and key(item) - key(clusters[-1][0]) <= tolerance:
+            clusters[-1].append(item)
+        else:
+            clusters.append([item])
+    return clusters
+
+
+def splitByLine(candidates, tolerance):
+    """ candidates are (lineParams, v0, v1) with close enough angles
+    and rhos, sorted by rho. But rho is measured where the line passes
+    nearest the origin, and two lines a hair apart in angle can drift
+    well apart far from there. So each line is anchored on its first
+    segment, and only takes segments with both ends within tolerance
+    of that segment's line; the rest get another go, anchored on the
+    first of them.
+
+    yields lists of (lineParams, v0, v1) """
+    while candidates:
+        (_, _, ux, uy), anchor, _ = candidates[0]
+        ax, ay = anchor.components
+        line = []
+        rest = []
+        for c in candidates:
+            _, v0, v1 = c
+            d0 = (v0.y() - ay) * ux - (v0.x() - ax) * uy
+            d1 = (v1.y() - ay) * ux - (v1.x() - ax) * uy
+            if abs(d0) <= tolerance and abs(d1) <= tolerance:
+                line.append(c)
+            else:
+                rest.append(c)
+        yield line
+        candidates = rest
+
+
+def emitRun(breaks, runEnd, tolerance, ax, ay, ux, uy, out):
+    """ appends segments covering one merged run of a line, split at
+    each of breaks (positions along the line) that isn't within
+    tolerance of the one before """
+    breaks.sort()
+    kept = [breaks[0]]
+    for b in breaks[1:]:
+        if b - kept[-1] > tolerance:
+            kept.append(b)
+    if len(kept) == 1:
+        kept.append(runEnd)
+    else:
+        kept[-1] = max(kept[-1], runEnd)
+    for i in range(1, len(kept)):
+        out.append((m.Vector2(ax + ux * kept[i - 1], ay + uy * kept[i - 1]),
+                    m.Vector2(ax + ux * kept[i], ay + uy * kept[i])))
+
+
+def mergeLine(line, tolerance, out):
+    """ appends segments covering the union of line's segments, which
+    all lie on the line through the first one, to out.
+
+    returns the doubled-up length taken out """
+    (_, _, ux, uy), anchor, _ = line[0]
+    ax, ay = anchor.components
+
+    # project every segment onto the first one's line
+    intervals = []
+    totalLength = 0.0
+    for lp, v0, v1 in line:
+        t0 = (v0.x() - ax) * ux + (v0.y() - ay) * uy
+        t1 = (v1.x() - ax) * ux + (v1.y() - ay) * uy
+        intervals.append((min(t0, t1), max(t0, t1)))
+        totalLength += abs(t1 - t0)
+    intervals.sort()
+
+    mergedLength = 0.0
+    runStart, runEnd = intervals[0]
+    breaks = [runStart, runEnd]
+    for start, end in intervals[1:]:
+        if start <= runEnd + tolerance:
+            runEnd = max(runEnd, end)
+            breaks.append(start)
+            breaks.append(end)
+        else:
+            emitRun(breaks, runEnd, tolerance, ax, ay, ux, uy, out)
+            mergedLength += runEnd - runStart
+            runStart, runEnd = start, end
+            breaks = [start, end]
+    emitRun(breaks, runEnd, tolerance, ax, ay, ux, uy, out)
+    mergedLength += runEnd - runStart
+
+    return max(0.0, totalLength - mergedLength)
+
+
+def removeCollinearOverlaps(segments, tolerance = 1e-2, angle_tolerance = 1e-3):
+    """ segments is a list of (Vector2, Vector2) tuples.
+
+    returns (newSegments, removedLength), where newSegments covers the
+    same ink with no segment drawn over another, and removedLength is
+    how much doubled-up length was taken out.
+    """
+    params = []
+    out = []
+    for v0, v1 in segments:
+        lp = lineParams(v0, v1, angle_tolerance)
+        if lp is None:
+            continue
+        params.append((lp, v0, v1))
+
+    params.sort(key = lambda p: p[0][0])
+
+    removedLength = 0.0
+
+    for angleGroup in clusterSorted(params, lambda p: p[0][0], angle_tolerance):
+        angleGroup.sort(key = lambda p: p[0][1])
+        for rhoGroup in clusterSorted(angleGroup, lambda p: p[0][1], tolerance):
+            for line in splitByLine(rhoGroup, tolerance):
+                removedLength += mergeLine(line, tolerance, out)
+
+    return out, removedLength
@@ -0,0 +1,295 @@
+import math
+import time
+import operator
+
+import bdgmath as m
+
+# Ordering paths to cut down on pen-up travel, which is where most of
+# a plotter's time goes.
+#
+# Paths here are lists of Vector2, and an ordering is a list of
+# (pathIndex, flipped) tuples, where flipped means the path is drawn
+# from its last point back to its first.
+
+
+def penUpDistance(paths, order, startpoint):
+    """ total distance travelled with the pen up, from startpoint
+    through each path of order """
+    total = 0.0
+    x, y = startpoint.components
+    for pi, flipped in order:
+        p = paths[pi]
+        if flipped:
+            sx, sy = p[-1].components
+            ex, ey = p[0].components
+        else:
+            sx, sy = p[0].components
+            ex, ey = p[-1].components
+        total += math.hypot(sx - x, sy - y)
+        x = ex
+        y = ey
+    return total
+
+
+def applyOrder(paths, order):
+    """ returns the paths, in order, reversed where flipped """
+    return [paths[pi][::-1] if flipped else paths[pi] for pi, flipped in order]
+
+
+class EndpointTree:
+    """ a 2d tree of path endpoints, for finding the nearest unused
+    one. Unlike a grid, it doesn't care how the endpoints are spread
+    out, so a tight cluster plus a few far-off stragglers is no
+    slower than an even scatter.
+
+    Node n covers the endpoints in points[lo[n]:hi[n]] and has
+    children 2n + 1 and 2n + 2, splitting its endpoints in half by x
+    or y, alternating with depth, down to buckets of LEAF_SIZE or
+    fewer that get searched straight through. Removed endpoints stay
+    in place, but each node counts how many live ones it still holds,
+    so empty subtrees get skipped. """
+
+    LEAF_SIZE = 16
+
+    def __init__(self, paths, pathIndices):
+        points = []
+        for pi in pathIndices:
+            p = paths[pi]
+            for flipped, v in ((False, p[0]), (True, p[-1])):
+                points.append((v.x(), v.y(), pi, flipped))
+
+        self.count = len(pathIndices)
+        self.builtCount = self.count
+
+        self.points = points
+        self.lo = []
+        self.hi = []
+        self.split = []
+        self.alive = []
+        self.build(0, 0, len(points), 0)
+
+        self.dead = [False] * len(points)
+        self.position = {}
+        for i, (x, y, pi, flipped) in enumerate(points):
+            self.position[(pi, flipped)] = i
+
+    def build(self, node, lo, hi, axis):
+        if node >= len(self.lo):
+            grow = node + 1 - len(self.lo)
+            self.lo.extend([0] * grow)
+            self.hi.extend([0] * grow)
+            self.split.extend([None] * grow)
+            self.alive.extend([0] * grow)
+        self.lo[node] = lo
+        self.hi[node] = hi
+        self.alive[node] = hi - lo
+        if hi - lo <= self.LEAF_SIZE:
+            return
+
+        key = operator.itemgetter(axis)
+        self.points[lo:hi] = sorted(self.points[lo:hi], key = key)
+        mid = (lo + hi) // 2
+        self.split[node] = self.points[mid][axis]
+        self.build(2 * node + 1, lo, mid, 1 - axis)
+        self.build(2 * node + 2, mid, hi, 1 - axis)
+
+    def remove(self, paths, pi):
+        self.count -= 1
+        alive = self.alive
+        split = self.split
+        for flipped in (False, True):
+            pos = self.position[(pi, flipped)]
+            self.dead[pos] = True
+
+            node = 0
+            while True:
+                alive[node] -= 1
+                if split[node] is None:
+                    break
+                if pos < (self.lo[node] + self.hi[node]) // 2:
+                    node = 2 * node + 1
+                else:
+                    node = 2 * node + 2
+
+    def nearest(self, paths, x, y):
+        """ returns (dist, pathIndex, flipped) for the nearest endpoint.
+        Ties go to the lowest path index, and to a path's start over
+        its end, as a linear scan would. """
+        if self.count == 0:
+            return None
+
+        points = self.points
+        alive = self.alive
+        split = self.split
+        dead = self.dead
+        sqrt = math.sqrt
+        best = None
+        bestD = math.inf
+
+        # (node, axis, how near it could be) still to search
+        stack = [(0, 0, 0.0)]
+        while stack:
+            node, axis, bound = stack.pop()
+            # best may have got nearer since this was pushed
+            if bound > bestD or alive[node] == 0:
+                continue
+
+            s = split[node]
+            if s is None:
+                for i in range(self.lo[node], self.hi[node]):
+                    if dead[i]:
+                        continue
+                    px, py, pi, flipped = points[i]
+                    dx = x - px
+                    dy = y - py
+                    candidate = (sqrt(dx * dx + dy * dy), pi, flipped)
+                    if best is None or candidate < best:
+                        best = candidate
+                        bestD = candidate[0]
+                continue
+
+            # nothing on the far side of the split can be nearer than
+            # the split itself; ties still need checking, so only
+            # what's strictly further gets skipped
+            diff = (x if axis == 0 else y) - s
+            if diff < 0:
+                stack.append((2 * node + 2, 1 - axis, max(bound, -diff)))
+                stack.append((2 * node + 1, 1 - axis, bound))
+            else:
+                stack.append((2 * node + 1, 1 - axis, max(bound, diff)))
+                stack.append((2 * node + 2, 1 - axis, bound))
+        return best
+
+
+def greedyOrder(paths, startpoint):
+    """ repeatedly picks the path with the nearest endpoint """
+    unused = set(range(len(paths)))
+    tree = EndpointTree(paths, unused)
+    order = []
+
+    x, y = startpoint.components
+    while unused:
+        # as paths get used up the tree fills with dead endpoints,
+        # which searches still step over, so rebuild it to fit what's left
+        if tree.count > 16 and tree.count * 4 < tree.builtCount:
+            tree = EndpointTree(paths, unused)
+
+        d, pi, flipped = tree.nearest(paths, x, y)
+        tree.remove(paths, pi)
+        unused.discard(pi)
+        order.append((pi, flipped))
+
+        end = paths[pi][0] if flipped else paths[pi][-1]
+        x, y = end.components
+    return order
+
+
+def refineOrder(paths, order, startpoint, time_limit = 1.0):
+    """ improves an ordering with 2-opt moves (reversing a run of
+    paths, and flipping each of them) and Or-opt moves (moving one
+    path elsewhere, in either direction), until no move helps or
+    time_limit seconds have passed. Returns the new ordering. """
+    deadline = time.perf_counter() + time_limit
+    order = list(order)
+    n = len(order)
+
+    def startOf(k):
+        pi, flipped = order[k]
+        return paths[pi][-1] if flipped else paths[pi][0]
+
+    def endOf(k):
+        pi, flipped = order[k]
+        return paths[pi][0] if flipped else paths[pi][-1]
+
+    def dist(a, b):
+        return math.hypot(a.x() - b.x(), a.y() - b.y())
+
+    def prevEnd(k):
+        return startpoint if k == 0 else endOf(k - 1)
+
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+
+        # 2-opt: reverse order[i..j]
+        for i in range(n):
+            if time.perf_counter() > deadline:
+                break
+            pe = prevEnd(i)
+            si = startOf(i)
+            for j in range(i, n):
+                ej = endOf(j)
+                before = dist(pe, si)
+                after = dist(pe, ej)
+                if j + 1 < n:
+                    sn = startOf(j + 1)
+                    before += dist(ej, sn)
+                    after += dist(si, sn)
+                if after < before - 1e-9:
+                    order[i:j + 1] = [(pi, not flipped) for pi, flipped in reversed(order[i:j + 1])]
+                    improved = True
+                    si = startOf(i)
+
+        # Or-opt: move order[k] to sit between order[j - 1] and order[j]
+        k = 0
+        while k < n:
+            if time.perf_counter() > deadline:
+                break
+            pe = prevEnd(k)
+            sk = startOf(k)
+            ek = endOf(k)
+
+            # what taking order[k] out saves
+            removeGain = dist(pe, sk)
+            if k + 1 < n:
+                sn = startOf(k + 1)
+                removeGain += dist(ek, sn) - dist(pe, sn)
+
+            bestGain = 1e-9
+            bestMove = None
+            for j in range(n + 1):
+                if j == k or j == k + 1:
+                    continue
+                a = prevEnd(j)
+                b = startOf(j) if j < n else None
+                for flipped in (False, True):
+                    s, e = (ek, sk) if flipped else (sk, ek)
+                    addCost = dist(a, s)
+                    if b is not None:
+                        addCost += dist(e, b) - dist(a, b)
+                    gain = removeGain - addCost
+                    if gain > bestGain:
+                        bestGain = gain
+                        bestMove = (j, flipped)
+
+            if bestMove is not None:
+                j, flipMove = bestMove
+                pi, flipped = order.pop(k)
+                if j > k:
+                    j -= 1
+                order.insert(j, (pi, flipped != flipMove))
+                improved = True
+            else:
+                k += 1
+
+    return order
+
+
+def optimizePathOrder(paths, startpoint = None, time_limit = 1.0):
+    """ orders paths greedily by nearest endpoint, then refines that
+    order for up to time_limit seconds (0 skips refinement).
+
+    returns (orderedPaths, penUpBefore, penUpAfter), the pen-up
+    distances being for the greedy order and for the final one.
+    """
+    if startpoint is None:
+        startpoint = m.Vector2(0, 0)
+
+    order = greedyOrder(paths, startpoint)
+    before = penUpDistance(paths, order, startpoint)
+
+    if time_limit > 0:
+        order = refineOrder(paths, order, startpoint, time_limit)
+    after = penUpDistance(paths, order, startpoint)
+
+    return applyOrder(paths, order), before, after
@@ -0,0 +1,250 @@
+import math
+
+import bdgmath as m
+
+# Guessing how long a plotter will take to draw something, before
+# sending it.
+#
+# Every pen-down stroke and every pen-up move is run through a
+# trapezoidal speed profile: speed up at a fixed acceleration, cruise,
+# slow down. A stroke has to slow down for its corners, by how sharp
+# they are, using the "junction deviation" rule that GRBL and friends
+# use; a straight run through a vertex doesn't slow down at all. Each
+# stroke also costs a pen drop before it and a pen lift after.
+#
+# The defaults are in the neighbourhood of an AxiDraw at its default
+# settings, with drawing units in mm. Set scale if your drawing units
+# aren't mm.
+
+
+def isStroke(path):
+    """ whether a path gets drawn at all. A path of fewer than two
+    points puts down no ink, so the estimates skip it entirely: no
+    travel to it, and no drop or lift. """
+    return len(path) >= 2
+
+
+class PlotEstimate:
+    """ what an estimate found. Times are in seconds, distances in
+    drawing units. """
+
+    def __init__(self):
+        self.totalTime = 0.0
+        self.penDownTime = 0.0
+        self.penUpTime = 0.0
+        self.liftTime = 0.0
+        self.inkLength = 0.0
+        self.penUpDistance = 0.0
+        self.liftCount = 0
+
+    def __str__(self):
+        minutes, seconds = divmod(self.totalTime, 60)
+        return (f"{int(minutes)}m{seconds:04.1f}s: "
+                f"{self.inkLength:0.1f} ink, "
+                f"{self.penUpDistance:0.1f} pen-up travel, "
+                f"{self.liftCount} lifts")
+
+
+class PlotTimeEstimator:
+    def __init__(self, pen_down_speed = 100, pen_up_speed = 250, accel = 1000,
+                 junction_deviation = 0.05, lift_time = 0.15, drop_time = 0.15,
+                 scale = 1.0):
+        """
+        pen_down_speed, pen_up_speed = top speeds, in mm/s
+        accel = acceleration, in mm/s^2
+        junction_deviation = how far, in mm, a corner is allowed to be
+            rounded off, which sets how fast it can be taken. Smaller
+            is slower.
+        lift_time, drop_time = seconds to raise and lower the pen
+        scale = mm per drawing unit
+        """
+        self.penDownSpeed = pen_down_speed
+        self.penUpSpeed = pen_up_speed
+        self.accel = accel
+        self.junctionDeviation = junction_deviation
+        self.liftTime = lift_time
+        self.dropTime = drop_time
+        self.scale = scale
+
+    def moveTime(self, dist, v0, v1, vMax):
+        """ time to cover dist mm, starting at speed v0 and ending at v1,
+        never going over vMax """
+        a = self.accel
+        # the speed we'd reach if we sped up, then slowed down, with no
+        # cruising in between
+        vPeak = math.sqrt((2 * a * dist + v0 * v0 + v1 * v1) / 2)
+        if vPeak <= vMax:
+            return max(2 * vPeak - v0 - v1, 0.0) / a
+
+        accelDist = (vMax * vMax - v0 * v0) / (2 * a)
+        decelDist = (vMax * vMax - v1 * v1) / (2 * a)
+        return ((vMax - v0) / a + (vMax - v1) / a +
+                (dist - accelDist - decelDist) / vMax)
+
+    def travelTime(self, dist):
+        """ time for a pen-up move of dist mm, from a stop to a stop """
+        return self.moveTime(dist, 0.0, 0.0, self.penUpSpeed)
+
+    def strokeTime(self, path):
+        """ returns (seconds, length in drawing units) to draw one
+        polyline with the pen down, from a stop to a stop. Drawing a
+        path backwards takes the same time. """
+        n = len(path)
+        if n < 2:
+            return 0.0, 0.0
+
+        scale = self.scale
+        vMax = self.penDownSpeed
+        a = self.accel
+        jd = self.junctionDeviation
+
+        lengths = []
+        # the fastest each vertex can be passed through, going by its
+        # corner alone
+        limits = [0.0]
+        prevUx = prevUy = None
+        for i in range(1, n):
+            x0, y0 = path[i - 1].components
+            x1, y1 = path[i].components
+            dx = (x1 - x0) * scale
+            dy = (y1 - y0) * scale
+            length = math.hypot(dx, dy)
+            if length == 0:
+                continue
+            ux = dx / length
+            uy = dy / length
+
+            if prevUx is not None:
+                cosTheta = -(prevUx * ux + prevUy * uy)
+                sinHalf = math.sqrt(max(0.5 * (1.0 - cosTheta), 0.0))
+                if sinHalf >= 1.0 - 1e-9:
+                    limits.append(vMax)
+                else:
+                    limits.append(min(vMax, math.sqrt(a * jd * sinHalf / (1.0 - sinHalf))))
+            lengths.append(length)
+            prevUx = ux
+            prevUy = uy
+        limits.append(0.0)
+
+        # then no faster than we can speed up to, or slow down from
+        numSegs = len(lengths)
+        for i in range(numSegs):
+            limits[i + 1] = min(limits[i + 1], math.sqrt(limits[i] * limits[i] + 2 * a * lengths[i]))
+        for i in range(numSegs - 1, -1, -1):
+            limits[i] = min(limits[i], math.sqrt(limits[i + 1] * limits[i + 1] + 2 * a * lengths[i]))
+
+        total = 0.0
+        for i in range(numSegs):
+            total += self.moveTime(lengths[i], limits[i], limits[i + 1], vMax)
+        return total, sum(lengths) / scale
+
+    def estimate(self, paths, startpoint = None, return_home = False):
+        """ paths is an ordered list of polylines (lists of Vector2), as
+        from EdgePool.getGreedySortedPaths. The pen starts, up, at
+        startpoint (the origin by default), and, if return_home is set,
+        goes back there at the end.
+
+        returns a PlotEstimate.
+        """
+        if startpoint is None:
+            startpoint = m.Vector2(0, 0)
+
+        est = PlotEstimate()
+        x, y = startpoint.components
+        for p in paths:
+            if not isStroke(p):
+                continue
+            t, length = self.strokeTime(p)
+            est.penDownTime += t
+            est.inkLength += length
+
+            sx, sy = p[0].components
+            d = math.hypot(sx - x, sy - y)
+            est.penUpDistance += d
+            est.penUpTime += self.travelTime(d * self.scale)
+            est.liftCount += 1
+            x, y = p[-1].components
+
+        if return_home:
+            d = math.hypot(startpoint.x() - x, startpoint.y() - y)
+            est.penUpDistance += d
+            est.penUpTime += self.travelTime(d * self.scale)
+
+        est.liftTime = est.liftCount * (self.liftTime + self.dropTime)
+        est.totalTime = est.penDownTime + est.penUpTime + est.liftTime
+        return est
+
+    def estimateOrders(self, paths, orders, startpoint = None):
+        """ for comparing orderings of the same paths. orders is a list
+        of orderings, as from pathorder (lists of (pathIndex, flipped)).
+        Since pen-down time doesn't depend on direction, each stroke is
+        timed only once.
+
+        returns a list of total times, one per ordering.
+        """
+        if startpoint is None:
+            startpoint = m.Vector2(0, 0)
+
+        strokeTimes = [self.strokeTime(p)[0] if isStroke(p) else None for p in paths]
+        liftTime = self.liftTime + self.dropTime
+        scale = self.scale
+
+        totals = []
+        for order in orders:
+            total = 0.0
+            x, y = startpoint.components
+            for pi, flipped in order:
+                if strokeTimes[pi] is None:
+                    continue
+                p = paths[pi]
+                if flipped:
+                    sx, sy = p[-1].components
+                    x1, y1 = p[0].components
+                else:
+                    sx, sy = p[0].components
+                    x1, y1 = p[-1].components
+                total += (strokeTimes[pi] + liftTime +
+                          self.travelTime(math.hypot(sx - x, sy - y) * scale))
+                x = x1
+                y = y1
+            totals.append(total)
+        return totals
+
+
+if __name__ == "__main__":
+    import time
+    import random
+
+    import edgepool
+    import pathorder
+
+    random.seed(1)
+
+    # a scatter of little squiggles
+    ep = edgepool.EdgePool()
+    for i in range(2000):
+        x = random.uniform(0, 250)
+        y = random.uniform(0, 180)
+        pts = [m.Vector2(x, y)]
+        for j in range(10):
+            x += random.uniform(-2, 2)
+            y += random.uniform(-2, 2)
+            pts.append(m.Vector2(x, y))
+        ep.addEdgeList(pts)
+
+    estimator = PlotTimeEstimator()
+    for name, paths in [("as built", list(ep.getPaths())),
+                        ("sorted by x", list(ep.getSortedPaths())),
+                        ("greedy", ep.getGreedySortedPaths()),
+                        ("optimized", ep.getOptimizedPaths(time_limit = 2.0)[0])]:
+        startTime = time.perf_counter()
+        est = estimator.estimate(paths)
+        elapsed = time.perf_counter() - startTime
+        print(f"{name}: {est} (estimated in {elapsed * 1000:0.1f}ms)")
+
+    paths = list(ep.getPaths())
+    orders = [pathorder.greedyOrder(paths, m.Vector2(0, 0)) for i in range(10)]
+    startTime = time.perf_counter()
+    estimator.estimateOrders(paths, orders)
+    elapsed = time.perf_counter() - startTime
+    print(f"10 orderings compared in {elapsed * 1000:0.1f}ms")
@@ -0,0 +1,327 @@
+import os
+import abc
+import time
+import array
+import random
+
+import bdgmath as m
+
+# Writing plotter output straight to a file, without building a
+# drawSvg object for every stroke and a command for every vertex.
+#
+# A writer takes polylines one at a time, as lists of Vector2, as
+# Vector2Arrays, or as flat (x0, y0, x1, y1, ...) arrays of doubles,
+# turns them into text, and writes that out in big chunks, so memory
+# stays flat no matter how big the drawing is.
+#
+# Coordinates are rounded onto a fixed grid before anything else, and
+# relative moves are taken between rounded positions, so rounding
+# errors can't pile up along a long path.
+
+CHUNK_SIZE = 1 << 16
+FORMAT_CACHE_SIZE = 1 << 16
+
+
+def flatCoords(polyline):
+    """ returns polyline as a flat sequence of x, y values """
+    if isinstance(polyline, m.Vector2Array):
+        return polyline.coords
+    if isinstance(polyline, array.array):
+        return polyline
+    coords = array.array('d')
+    for v in polyline:
+        coords.extend(v.components)
+    return coords
+
+
+def formatFixed(q, precision):
+    """ formats q / 10**precision, for an integer q, as compactly as
+    possible: no trailing zeros, no trailing point, no leading zero """
+    if precision == 0:
+        return str(q)
+    s = f"{abs(q):0{precision + 1}d}"
+    whole = s[:-precision]
+    frac = s[-precision:].rstrip('0')
+    if whole == '0' and frac:
+        whole = ''
+    out = whole + '.' + frac if frac else whole
+    return '-' + out if q < 0 else out
+
+
+class PlotWriter(abc.ABC):
+    """ the buffering that all the writers share. Use as a context
+    manager, or call close() when done. """
+
+    def __init__(self, f, chunk_size = CHUNK_SIZE):
+        """
+        f = a filename (or path), or a file object opened for text
+        """
+        if isinstance(f, (str, os.PathLike)):
+            self.file = open(os.fspath(f), "w")
+            self.ownsFile = True
+        else:
+            self.file = f
+            self.ownsFile = False
+
+        self.chunkSize = chunk_size
+        self.buffer = []
+        self.bufferLen = 0
+        self.closed = False
+
+        self.numPolylines = 0
+        self.numPoints = 0
+
+        self.writeHeader()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def emit(self, s):
+        self.buffer.append(s)
+        self.bufferLen += len(s)
+        if self.bufferLen >= self.chunkSize:
+            self.flush()
+
+    def flush(self):
+        self.file.write(''.join(self.buffer))
+        self.buffer = []
+        self.bufferLen = 0
+
+    def close(self):
+        if self.closed:
+            return
+        self.writeFooter()
+        self.flush()
+        if self.ownsFile:
+            self.file.close()
+        self.closed = True
+
+    def writePolyline(self, polyline):
+        coords = flatCoords(polyline)
+        if len(coords) < 4:
+            return
+        self.numPolylines += 1
+        self.numPoints += len(coords) // 2
+        self.writeCoords(coords)
+
+    def writePolylines(self, polylines):
+        for pl in polylines:
+            self.writePolyline(pl)
+
+    def writeHeader(self):
+        pass
+
+    def writeFooter(self):
+        pass
+
+    @abc.abstractmethod
+    def writeCoords(self, coords):
+        """ writes one polyline, given as a flat array of x, y values """
+
+
+class SvgWriter(PlotWriter):
+    """ writes an SVG laid out the way drawSvg lays one out (y up,
+    origin at the bottom left, or at the center), with all the
+    polylines in <path> elements of relative moves """
+
+    def __init__(self, f, width, height, origin = (0, 0),
+                 stroke_width = 2, color = 'black', precision = 2,
+                 max_path_length = 1 << 20, chunk_size = CHUNK_SIZE):
+        """
+        width, height, origin = as for drawSvg.Drawing
+        precision = digits after the decimal point
+        max_path_length = roughly how many characters go in one <path>
+            before starting another, as some tools choke on huge ones
+        """
+        self.width = width
+        self.height = height
+        if origin == 'center':
+            origin = (-width / 2, -height / 2)
+        self.origin = origin
+        self.strokeWidth = stroke_width
+        self.color = color
+        self.precision = precision
+        self.scale = 10 ** precision
+        self.maxPathLength = max_path_length
+        self.formatCache = {}
+
+        # rounded pen position, or None outside of a <path>
+        self.penX = None
+        self.penY = None
+        self.pathLength = 0
+
+        PlotWriter.__init__(self, f, chunk_size)
+
+    def writeHeader(self):
+        ox, oy = self.origin
+        self.emit('<?xml version="1.0" encoding="UTF-8"?>\n'
+                  '<svg xmlns="http://www.w3.org/2000/svg" '
+                  f'width="{self.width}" height="{self.height}" '
+                  f'viewBox="{ox} {-oy - self.height} {self.width} {self.height}">\n')
+
+    def writeFooter(self):
+        self.endPath()
+        self.emit('</svg>\n')
+
+    def startPath(self):
+        self.emit('<path stroke="' + str(self.color) +
+                  '" stroke-width="' + str(self.strokeWidth) +
+                  '" fill="none" d="')
+        self.penX = 0
+        self.penY = 0
+        self.pathLength = 0
+
+    def endPath(self):
+        if self.penX is not None:
+            self.emit('"/>\n')
+            self.penX = None
+            self.penY = None
+
+    def writeCoords(self, coords):
+        if self.penX is None:
+            self.startPath()
+
+        scale = self.scale
+        precision = self.precision
+        cache = self.formatCache
+
+        # round onto the grid first, negating y as drawSvg does, as
+        # svg's y runs down the page
+        qs = [round(c * scale) for c in coords]
+        qs[1::2] = [-q for q in qs[1::2]]
+
+        prev = [self.penX, self.penY]
+        prev.extend(qs[:-2])
+        deltas = [q - p for q, p in zip(qs, prev)]
+
+        # plotted lines mostly take small steps, so the same deltas
+        # come up over and over
+        parts = []
+        for d in deltas:
+            s = cache.get(d)
+            if s is None:
+                s = formatFixed(d, precision)
+                if len(cache) < FORMAT_CACHE_SIZE:
+                    cache[d] = s
+            parts.append(s)
+
+        self.penX = qs[-2]
+        self.penY = qs[-1]
+
+        s = 'm' + ' '.join(parts[:2]) + 'l' + ' '.join(parts[2:]) + ' '
+        self.emit(s)
+        self.pathLength += len(s)
+        if self.pathLength >= self.maxPathLength:
+            self.endPath()
+
+
+class HpglWriter(PlotWriter):
+    """ writes HPGL, with PU to move to the start of each polyline and
+    PD to draw it """
+
+    def __init__(self, f, scale = 40, pen = 1, chunk_size = CHUNK_SIZE):
+        """
+        scale = plotter units per drawing unit. HPGL plotters use
+            40 units per mm, so the default suits drawings in mm.
+        pen = which pen to select
+        """
+        self.scale = scale
+        self.pen = pen
+        PlotWriter.__init__(self, f, chunk_size)
+
+    def writeHeader(self):
+        self.emit(f"IN;SP{self.pen};\n")
+
+    def writeFooter(self):
+        self.emit("PU;SP0;\n")
+
+    def writeCoords(self, coords):
+        scale = self.scale
+        parts = [f"PU{round(coords[0] * scale)},{round(coords[1] * scale)};PD"]
+        parts.append(','.join(str(round(c * scale)) for c in coords[2:]))
+        parts.append(';\n')
+        self.emit(''.join(parts))
+
+
+class GcodeWriter(PlotWriter):
+    """ writes G-code for a pen plotter: a rapid move to the start of
+    each polyline, then feed moves along it """
+
+    def __init__(self, f, feed_rate = 3000, pen_up = "M5", pen_down = "M3",
+                 scale = 1.0, precision = 3, chunk_size = CHUNK_SIZE):
+        """
+        feed_rate = drawing speed, in units per minute
+        pen_up, pen_down = the commands that lift and drop the pen,
+            which vary from machine to machine (servo M3/M5, or a Z
+            move like "G0 Z5")
+        scale = machine units (mm) per drawing unit
+        precision = digits after the decimal point
+        """
+        self.feedRate = feed_rate
+        self.penUpCommand = pen_up
+        self.penDownCommand = pen_down
+        self.scale = scale
+        self.precision = precision
+        PlotWriter.__init__(self, f, chunk_size)
+
+    def writeHeader(self):
+        self.emit(f"G21\nG90\n{self.penUpCommand}\n")
+
+    def writeFooter(self):
+        self.emit(f"{self.penUpCommand}\nG0 X0 Y0\n")
+
+    def writeCoords(self, coords):
+        scale = self.scale
+        fmt = f".{self.precision}f"
+        parts = [f"G0 X{coords[0] * scale:{fmt}} Y{coords[1] * scale:{fmt}}",
+                 self.penDownCommand,
+                 f"G1 F{self.feedRate}"]
+        for i in range(2, len(coords), 2):
+            parts.append(f"G1 X{coords[i] * scale:{fmt}} Y{coords[i + 1] * scale:{fmt}}")
+        parts.append(self.penUpCommand)
+        parts.append('')
+        self.emit('\n'.join(parts))
+
+
+if __name__ == "__main__":
+    import io
+    import drawSvg as draw
+
+    random.seed(1)
+
+    # a random walk, chopped into polylines
+    polylines = []
+    x = y = 500.0
+    for i in range(2000):
+        pl = array.array('d')
+        for j in range(100):
+            x = m.clamp(x + random.uniform(-5, 5), 0, 1000)
+            y = m.clamp(y + random.uniform(-5, 5), 0, 1000)
+            pl.append(x)
+            pl.append(y)
+        polylines.append(pl)
+    numVerts = sum(len(pl) // 2 for pl in polylines)
+
+    startTime = time.perf_counter()
+    dwg = draw.Drawing(1000, 1000)
+    for pl in polylines:
+        p = draw.Path(stroke_width = 2, stroke = 'black', fill = 'none')
+        p.M(pl[0], pl[1])
+        for i in range(2, len(pl), 2):
+            p.L(pl[i], pl[i + 1])
+        dwg.append(p)
+    out = io.StringIO()
+    dwg.asSvg(outputFile = out)
+    elapsed = time.perf_counter() - startTime
+    print(f"drawSvg: {numVerts} vertices, {len(out.getvalue())} bytes in {elapsed:0.2f}s")
+
+    for cls, args in [(SvgWriter, (1000, 1000)), (HpglWriter, ()), (GcodeWriter, ())]:
+        out = io.StringIO()
+        startTime = time.perf_counter()
+        with cls(out, *args) as w:
+            w.writePolylines(polylines)
+        elapsed = time.perf_counter() - startTime
+        print(f"{cls.__name__}: {numVerts} vertices, {len(out.getvalue())} bytes in {elapsed:0.2f}s")
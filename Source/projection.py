@@ -0,0 +1,148 @@
+import array
+
+import numpy as np
+
+import bdgmath as m
+
+# Projects 3d wireframes down to 2d polylines for plotting.
+#
+# Every vertex of every polyline is packed into one n x 3 array, run
+# through the composed model/view transform, tested against the near
+# plane and divided through by depth, all in whole-array passes. The
+# camera sits at the origin of view space, looking down +z, so a point
+# is visible if its view-space z is at least near. Only polylines that
+# actually cross the near plane get walked point by point, to cut them.
+
+
+def polylineCoords(pl):
+    """ one polyline as an n x 3 array of doubles. pl may be an n x 3
+    (or flat) ndarray, a flat array('d') of x, y, z values, or a list
+    of Vector3. The first two are used as they are; a list has to be
+    unpacked vertex by vertex, so pass arrays if speed matters. """
+    if isinstance(pl, np.ndarray):
+        return pl.astype(np.float64, copy = False).reshape(-1, 3)
+    if isinstance(pl, array.array):
+        return np.frombuffer(pl, dtype = np.float64).reshape(-1, 3)
+    return np.array([v.components for v in pl], dtype = np.float64).reshape(-1, 3)
+
+
+class Projection:
+    def __init__(self, focal_length, near = 0.1, center = None):
+        """
+        focal_length = scale from view space to drawing units at z = 1
+        near = distance of the near clipping plane
+        center = where the view axis lands in the drawing (Vector2)
+        """
+        self.focalLength = focal_length
+        self.near = near
+        if center is None:
+            center = m.Vector2(0, 0)
+        self.center = center
+
+    def projectPolylines(self, polylines, model = None, view = None):
+        """ polylines is a list of 3d polylines, each in any form
+        polylineCoords takes. model and view are Matrix4s (either can
+        be None for the identity).
+
+        returns a list of 2d polylines (Vector2Arrays), suitable for
+        EdgePool.addEdgeList. A polyline that crosses the near plane
+        is cut there, which can split it into several pieces.
+        """
+        modelView = m.Matrix4()
+        if view is not None:
+            modelView = view
+        if model is not None:
+            modelView = modelView.mulMat4(model)
+
+        pieces = [polylineCoords(pl) for pl in polylines]
+        pieces = [p for p in pieces if len(p) >= 2]
+        if not pieces:
+            return []
+        lengths = np.array([len(p) for p in pieces])
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+
+        mat = np.array(modelView.components)
+        viewCoords = np.concatenate(pieces) @ mat[:, :3].T + mat[:, 3]
+
+        z = viewCoords[:, 2]
+        visible = z >= self.near
+        # hidden points get divided by 1 instead, and are never used
+        scale = self.focalLength / np.where(visible, z, 1.0)
+        projected = viewCoords[:, :2] * scale[:, None] + self.center.components
+
+        hiddenBefore = np.concatenate(([0], np.cumsum(~visible)))
+        hiddenCounts = hiddenBefore[ends] - hiddenBefore[starts]
+
+        outPolylines = []
+        for start, end, hidden in zip(starts.tolist(), ends.tolist(), hiddenCounts.tolist()):
+            if hidden == 0:
+                coords = array.array('d')
+                coords.frombytes(projected[start:end].tobytes())
+                outPolylines.append(m.Vector2Array(coords))
+            elif hidden < end - start:
+                self.clipAndProject(viewCoords[start:end].tolist(),
+                                    projected[start:end].tolist(),
+                                    visible[start:end].tolist(),
+                                    outPolylines)
+        return outPolylines
+
+    def projectPoint(self, x, y, z):
+        s = self.focalLength / z
+        return m.Vector2(self.center.x() + x * s,
+                         self.center.y() + y * s)
+
+    def clipAndProject(self, viewCoords, projected, visible, outPolylines):
+        """ cuts one polyline where it crosses the near plane. The
+        visible points are already in projected; only the crossings
+        need working out here. """
+        near = self.near
+        current = array.array('d')
+
+        for i, (x, y, z) in enumerate(viewCoords):
+            if i > 0 and visible[i] != visible[i - 1]:
+                px, py, pz = viewCoords[i - 1]
+                t = (near - pz) / (z - pz)
+                crossing = self.projectPoint(px + (x - px) * t,
+                                             py + (y - py) * t,
+                                             near)
+                current.extend(crossing.components)
+                if not visible[i]:
+                    # leaving through the near plane
+                    if len(current) >= 4:
+                        outPolylines.append(m.Vector2Array(current))
+                    current = array.array('d')
+
+            if visible[i]:
+                current.extend(projected[i])
+
+        if len(current) >= 4:
+            outPolylines.append(m.Vector2Array(current))
+
+
+if __name__ == "__main__":
+    import time
+    import random
+
+    rng = random.Random(1)
+    polylines = []
+    for i in range(2000):
+        x = rng.uniform(-50, 50)
+        y = rng.uniform(-50, 50)
+        z = rng.uniform(-20, 100)
+        pl = []
+        for j in range(100):
+            pl.append(m.Vector3(x, y, z))
+            x += rng.uniform(-1, 1)
+            y += rng.uniform(-1, 1)
+            z += rng.uniform(-1, 1)
+        polylines.append(pl)
+    arrays = [polylineCoords(pl) for pl in polylines]
+
+    proj = Projection(100, near = 1.0)
+    camera = m.makeTranslationMat4(0, 0, 10)
+    for name, data in [("Vector3 lists", polylines), ("ndarrays", arrays)]:
+        startTime = time.perf_counter()
+        out = proj.projectPolylines(data, view = camera)
+        elapsed = time.perf_counter() - startTime
+        print(f"{name}: {sum(len(p) for p in out)} points in {len(out)} polylines, {elapsed:0.3f}s")
@@ -0,0 +1,100 @@
+import bdgmath as m
+
+# Polyline simplification. Contours and flattened curves come out
+# with long runs of nearly collinear vertices, and every one of them
+# costs file size and plotter motion.
+#
+# These work on lists of points (anything with x() and y()), and
+# return the positions, in the list, of the points to keep, so they
+# can be used on lists of vertex indices as easily as on Vector2s.
+
+
+def distToSegmentSqr(px, py, ax, ay, bx, by):
+    dx = bx - ax
+    dy = by - ay
+    lenSqr = dx * dx + dy * dy
+    if lenSqr == 0:
+        ex = px - ax
+        ey = py - ay
+        return ex * ex + ey * ey
+    t = m.clamp(((px - ax) * dx + (py - ay) * dy) / lenSqr, 0.0, 1.0)
+    ex = px - (ax + t * dx)
+    ey = py - (ay + t * dy)
+    return ex * ex + ey * ey
+
+
+def douglasPeucker(points, tolerance):
+    """ keeps the points needed so that no dropped point is further
+    than tolerance from the simplified polyline """
+    n = len(points)
+    if n < 3:
+        return list(range(n))
+
+    xs = [p.x() for p in points]
+    ys = [p.y() for p in points]
+    tolSqr = tolerance * tolerance
+
+    keep = [False] * n
+    keep[0] = True
+    keep[-1] = True
+
+    # an explicit stack, so long polylines don't hit the recursion limit
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        ax = xs[first]
+        ay = ys[first]
+        bx = xs[last]
+        by = ys[last]
+
+        worstDist = -1.0
+        worstIndex = first
+        for i in range(first + 1, last):
+            d = distToSegmentSqr(xs[i], ys[i], ax, ay, bx, by)
+            if d > worstDist:
+                worstDist = d
+                worstIndex = i
+
+        if worstDist > tolSqr:
+            keep[worstIndex] = True
+            stack.append((first, worstIndex))
+            stack.append((worstIndex, last))
+
+    return [i for i in range(n) if keep[i]]
+
+
+def removeCollinear(points):
+    """ drops points that lie exactly on the straight line between
+    their neighbors, heading the same way, which changes nothing
+    about the drawing """
+    n = len(points)
+    if n < 3:
+        return list(range(n))
+
+    kept = [0]
+    for i in range(1, n - 1):
+        a = points[kept[-1]]
+        b = points[i]
+        c = points[i + 1]
+        abx = b.x() - a.x()
+        aby = b.y() - a.y()
+        bcx = c.x() - b.x()
+        bcy = c.y() - b.y()
+        if abx * bcy - aby * bcx == 0 and abx * bcx + aby * bcy >= 0:
+            continue
+        kept.append(i)
+    kept.append(n - 1)
+    return kept
+
+
+def simplifyPolyline(points, tolerance = 0):
+    """ returns the kept points of a polyline: exactly collinear points
+    are always dropped, and if tolerance is above zero, the result is
+    simplified further with Douglas-Peucker """
+    kept = [points[i] for i in removeCollinear(points)]
+    if tolerance > 0:
+        kept = [kept[i] for i in douglasPeucker(kept, tolerance)]
+    return kept
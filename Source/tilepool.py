@@ -0,0 +1,458 @@
+import os
+import math
+import array
+import bisect
+import itertools
+import multiprocessing
+
+import numpy as np
+
+import bdgmath as m
+import edgepool
+
+# Building a big EdgePool across several processes.
+#
+# The page is cut into tiles, and each tile gets its own EdgePool, in a
+# worker process. An EdgePool welds each new point to the earliest
+# vertex within EPSILON, so which vertex a point ends up on depends on
+# every point before it that's within EPSILON, and on every point
+# before those, and so on. Points in different tiles can only be that
+# close if both are near the boundary between them, so a tile can
+# weld its points on its own, exactly as a serial build would, except
+# for those joined to a seam by a chain of points less than EPSILON
+# apart. Those "linked" points are welded in the main process, in
+# their original order, and the few segments that touch one, or that
+# cross between tiles, are added there too, one at a time.
+#
+# Whatever the main process does per vertex or per segment doesn't
+# get any faster with more workers, so it only does that with numpy,
+# or in bulk. Workers are handed all the segments once, when they
+# start, and pick out their own tile's; they send back their pools as
+# flat arrays; and the stitched pool keeps its vertices in a
+# Vector2Array, so they're copied in whole. Only linked points and
+# the segments through them get looked at one by one.
+
+# the segments, the tile each endpoint and each segment is in, and the
+# TileLayout, for the worker processes
+tileJob = None
+
+
+class TileLayout:
+    """ a grid of tiles covering some bounds """
+
+    def __init__(self, minX, minY, maxX, maxY, numX, numY):
+        self.minX = minX
+        self.minY = minY
+        self.numX = numX
+        self.numY = numY
+        self.tileW = max(maxX - minX, 1e-9) / numX
+        self.tileH = max(maxY - minY, 1e-9) / numY
+
+    def tileOf(self, xs, ys):
+        """ the tile each point is in, for arrays of coordinates """
+        tx = np.minimum(((xs - self.minX) * (1.0 / self.tileW)).astype(np.int64), self.numX - 1)
+        ty = np.minimum(((ys - self.minY) * (1.0 / self.tileH)).astype(np.int64), self.numY - 1)
+        return ty * self.numX + tx
+
+    def nearSeam(self, xs, ys, tile, eps):
+        """ which of the points, given as arrays of coordinates, are
+        within eps of a boundary that tile shares with another tile """
+        tx = tile % self.numX
+        ty = tile // self.numX
+        x0 = self.minX + tx * self.tileW
+        y0 = self.minY + ty * self.tileH
+        near = np.zeros(len(xs), dtype = bool)
+        if tx > 0:
+            near |= xs - x0 < eps
+        if tx < self.numX - 1:
+            near |= x0 + self.tileW - xs < eps
+        if ty > 0:
+            near |= ys - y0 < eps
+        if ty < self.numY - 1:
+            near |= y0 + self.tileH - ys < eps
+        return near
+
+
+def segmentCoords(segments):
+    """ segments as an (n, 4) array of x0, y0, x1, y1 rows. Passing
+    them in that form, or as a flat array of doubles, saves making
+    one here. """
+    if isinstance(segments, np.ndarray):
+        return segments.astype(np.float64, copy = False).reshape(-1, 4)
+    if isinstance(segments, m.Vector2Array):
+        segments = segments.coords
+    if isinstance(segments, array.array):
+        return np.frombuffer(segments, dtype = np.float64).reshape(-1, 4)
+    return np.array([(v0.x(), v0.y(), v1.x(), v1.y()) for v0, v1 in segments],
+                    dtype = np.float64).reshape(-1, 4)
+
+
+def planTiles(coords, tiles):
+    """ returns (coords, pointTiles, segTiles, layout): the segments,
+    the tile each endpoint is in (endpoint k of segment s being point
+    2 s + k), the tile each segment is in, or -1 if it crosses into
+    another, and the TileLayout """
+    xs = coords[:, 0::2]
+    ys = coords[:, 1::2]
+    layout = TileLayout(float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max()), *tiles)
+
+    pointTiles = layout.tileOf(xs.ravel(), ys.ravel())
+    startTiles = pointTiles[0::2]
+    endTiles = pointTiles[1::2]
+    segTiles = np.where(startTiles == endTiles, startTiles, -1)
+    return coords, pointTiles, segTiles, layout
+
+
+def startWorker(coords, pointTiles, segTiles, layout):
+    """ hands a worker the job, once, as it starts """
+    global tileJob
+    tileJob = (coords, pointTiles, segTiles, layout)
+
+
+def findLinked(xs, ys, seeds, eps):
+    """ seeds, plus every point joined to a seed by a chain of points
+    less than eps apart, for arrays of coordinates """
+    linked = seeds.tolist()
+    todo = np.flatnonzero(seeds).tolist()
+    if not todo:
+        return seeds
+
+    # the points sorted by eps-sized cell, cells numbered row by row,
+    # so each row of three neighbouring cells is one run of the sort
+    cx = np.floor(xs / eps).astype(np.int64)
+    cy = np.floor(ys / eps).astype(np.int64)
+    cx -= cx.min() - 1
+    cy -= cy.min() - 1
+    rowLen = int(cx.max()) + 2
+    cells = cy * rowLen + cx
+    order = np.argsort(cells, kind = 'stable')
+    sortedCells = cells[order].tolist()
+    order = order.tolist()
+    cells = cells.tolist()
+    xs = xs.tolist()
+    ys = ys.tolist()
+    epsSqr = eps * eps
+
+    while todo:
+        i = todo.pop()
+        x = xs[i]
+        y = ys[i]
+        for row in (cells[i] - rowLen, cells[i], cells[i] + rowLen):
+            lo = bisect.bisect_left(sortedCells, row - 1)
+            hi = bisect.bisect_right(sortedCells, row + 1, lo)
+            for j in order[lo:hi]:
+                if linked[j]:
+                    continue
+                dx = x - xs[j]
+                dy = y - ys[j]
+                if dx * dx + dy * dy < epsSqr:
+                    linked[j] = True
+                    todo.append(j)
+    return np.array(linked, dtype = bool)
+
+
+def buildTile(tile):
+    """ runs in a worker: builds an EdgePool from the points in tile
+    that aren't linked to a seam, and the segments between them, and
+    returns it as arrays:
+
+    vertexCoords = (numVerts, 2) vertex positions
+    vertexPoints = the point each vertex was made from
+    pathVerts, pathLens = the paths' vertices, one path after another,
+        and how many there are in each
+    linkedPoints = the points linked to a seam, which the main
+        process has to weld
+    deferredPoints, deferredVerts = the other points that are on a
+        segment left for the main process, and their vertices
+    """
+    coords, pointTiles, segTiles, layout = tileJob
+    eps = edgepool.EPSILON
+
+    pointIds = np.flatnonzero(pointTiles == tile)
+    points = coords.reshape(-1, 2)[pointIds]
+    xs = points[:, 0]
+    ys = points[:, 1]
+    # anything within eps of a point over the seam is within eps of
+    # the seam itself; twice that leaves room for rounding
+    linked = findLinked(xs, ys, layout.nearSeam(xs, ys, tile, 2 * eps), eps)
+
+    # weld the points in their original order, as a serial build would
+    ep = edgepool.EdgePool()
+    Vector2 = m.Vector2
+    pointVerts = np.full(len(pointIds), -1, dtype = np.int64)
+    pointVerts[~linked] = [ep.insertVert(Vector2(x, y))
+                           for x, y in zip(xs[~linked].tolist(), ys[~linked].tolist())]
+
+    # a segment's endpoints are next to each other in pointIds, as
+    # they're points 2 s and 2 s + 1
+    segIds = np.flatnonzero(segTiles == tile)
+    starts = np.searchsorted(pointIds, 2 * segIds)
+    inTile = ~(linked[starts] | linked[starts + 1])
+    for a, b in zip(pointVerts[starts[inTile]].tolist(), pointVerts[starts[inTile] + 1].tolist()):
+        ep.addEdgeIndices(a, b)
+
+    deferred = segTiles[pointIds // 2] < 0
+    deferred[starts[~inTile]] = True
+    deferred[starts[~inTile] + 1] = True
+    deferred &= ~linked
+
+    paths = [p.toList() for p in ep.pathsById.values()]
+    pathLens = np.array([len(p) for p in paths], dtype = np.int64)
+    pathVerts = np.fromiter(itertools.chain.from_iterable(paths), dtype = np.int64)
+
+    return (vertexArray(ep), makingPoints(pointVerts[~linked], pointIds[~linked]),
+            pathVerts, pathLens,
+            pointIds[linked], pointIds[deferred], pointVerts[deferred])
+
+
+def vertexArray(ep):
+    """ the pool's vertices as a (numVerts, 2) array """
+    return np.fromiter(itertools.chain.from_iterable(v.components for v in ep.vertices),
+                       dtype = np.float64).reshape(-1, 2)
+
+
+def makingPoints(pointVerts, pointIds):
+    """ given the vertex each point was welded to, in the order they
+    went in, the id of the point that made each vertex """
+    return pointIds[np.unique(pointVerts, return_index = True)[1]]
+
+
+def chooseTileCounts(processes):
+    """ a few tiles per process, so an uneven drawing still keeps them
+    all busy """
+    side = max(1, math.ceil(math.sqrt(processes * 4)))
+    return side, side
+
+
+def buildEdgePoolParallel(segments, processes = None, tiles = None):
+    """ segments is a list of (Vector2, Vector2) tuples, as for
+    EdgePool.addEdge, or, cheaper for big jobs, the same as flat
+    x0, y0, x1, y1 values (an array of doubles, a Vector2Array, or a
+    numpy array).
+
+    processes = number of worker processes, os.cpu_count() by default
+    tiles = (numX, numY), by default a few per process
+
+    returns an EdgePool with the same vertices, in the same order, and
+    the same edges, that adding the segments one at a time would give,
+    so adding more edges to it welds them the same way too. Only how
+    the edges are split into paths may differ. Its vertices are in a
+    Vector2Array rather than a list.
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if tiles is None:
+        tiles = chooseTileCounts(processes)
+
+    ep = edgepool.EdgePool()
+    coords = segmentCoords(segments)
+    if len(coords) == 0:
+        return ep
+    ep.vertices = m.Vector2Array()
+
+    job = planTiles(coords, tiles)
+    numTiles = tiles[0] * tiles[1]
+    if processes > 1:
+        # imap hands back tiles in order as they finish, so stitching
+        # the early ones overlaps with building the later ones
+        with multiprocessing.Pool(processes, startWorker, job) as workers:
+            stitchTiles(ep, workers.imap(buildTile, range(numTiles)), job)
+    else:
+        startWorker(*job)
+        try:
+            stitchTiles(ep, map(buildTile, range(numTiles)), job)
+        finally:
+            startWorker(None, None, None, None)
+    return ep
+
+
+def stitchTiles(ep, results, job):
+    """ fills the empty pool ep, whose vertices are a Vector2Array,
+    from buildTile results. The linked points are welded here, then
+    every vertex is numbered by the point that made it, as in a serial
+    build, before the segments left over are added """
+    coords, pointTiles, segTiles, layout = job
+    vertexParts = []
+    madeByParts = []
+    pathParts = []
+    pathLenParts = []
+    linkedParts = []
+    deferredParts = []
+    offset = 0
+    for (vertexCoords, vertexPoints, pathVerts, pathLens,
+         linkedPoints, deferredPoints, deferredVerts) in results:
+        vertexParts.append(vertexCoords)
+        madeByParts.append(vertexPoints)
+        pathParts.append(pathVerts + offset)
+        pathLenParts.append(pathLens)
+        linkedParts.append(linkedPoints)
+        deferredParts.append((deferredPoints, deferredVerts + offset))
+        offset += len(vertexCoords)
+
+    # no tile vertex is within EPSILON of a linked point, so these
+    # only weld to each other, in their original order
+    linkedPoints = np.sort(np.concatenate(linkedParts))
+    seams = edgepool.EdgePool()
+    Vector2 = m.Vector2
+    points = coords.reshape(-1, 2)[linkedPoints]
+    linkedVerts = np.array([seams.insertVert(Vector2(x, y))
+                            for x, y in zip(points[:, 0].tolist(), points[:, 1].tolist())],
+                           dtype = np.int64)
+    vertexParts.append(vertexArray(seams))
+    madeByParts.append(makingPoints(linkedVerts, linkedPoints))
+
+    order = np.argsort(np.concatenate(madeByParts))
+    renumber = np.empty_like(order)
+    renumber[order] = np.arange(len(order))
+    vertexCoords = np.concatenate(vertexParts)[order]
+    ep.vertices.coords.frombytes(vertexCoords.tobytes())
+    fillGrid(ep, vertexCoords)
+
+    pointVerts = np.full(len(pointTiles), -1, dtype = np.int64)
+    for deferredPoints, deferredVerts in deferredParts:
+        pointVerts[deferredPoints] = renumber[deferredVerts]
+    pointVerts[linkedPoints] = renumber[linkedVerts + offset]
+
+    addPaths(ep, renumber[np.concatenate(pathParts)], np.concatenate(pathLenParts))
+
+    isLinked = np.zeros(len(pointTiles), dtype = bool)
+    isLinked[linkedPoints] = True
+    deferred = (segTiles < 0) | isLinked[0::2] | isLinked[1::2]
+    addEdgeIndices = ep.addEdgeIndices
+    for a, b in pointVerts.reshape(-1, 2)[deferred].tolist():
+        addEdgeIndices(a, b)
+
+
+def fillGrid(ep, vertexCoords):
+    """ builds ep.vertexGrid for its vertices, given as an array, in
+    one go, each cell's vertices in index order as insertVert keeps
+    them """
+    keys = np.floor(vertexCoords / edgepool.EPSILON).astype(np.int64)
+    order = np.lexsort((keys[:, 1], keys[:, 0]))
+    keys = keys[order]
+    cellEnds = (np.flatnonzero((keys[1:] != keys[:-1]).any(axis = 1)) + 1).tolist()
+    cellEnds.append(len(order))
+    cellStarts = [0] + cellEnds[:-1]
+    order = order.tolist()
+    ep.vertexGrid = dict(zip(zip(keys[cellStarts, 0].tolist(), keys[cellStarts, 1].tolist()),
+                             [tuple(order[s:e]) for s, e in zip(cellStarts, cellEnds)]))
+
+
+def addPaths(ep, pathVerts, pathLens):
+    """ adds paths, given as their vertices one path after another and
+    how many there are in each, and their edges, to ep """
+    if len(pathVerts) < 2:
+        return
+    pathOfVert = np.repeat(np.arange(len(pathLens)), pathLens)
+    inner = pathOfVert[:-1] == pathOfVert[1:]
+    a = pathVerts[:-1][inner]
+    b = pathVerts[1:][inner]
+    ep.connectedVerts.update(zip(np.minimum(a, b).tolist(), np.maximum(a, b).tolist()))
+
+    pathEnds = np.cumsum(pathLens).tolist()
+    pathVerts = pathVerts.tolist()
+    addPath = ep.addPath
+    EdgePath = edgepool.EdgePath
+    for s, e in zip([0] + pathEnds[:-1], pathEnds):
+        addPath(EdgePath(pathVerts[s:e]))
+
+
+def edgeSet(ep, digits = 6):
+    """ the pool's edges, as pairs of rounded coordinates, for
+    comparing pools """
+    edges = set()
+    for p in ep.getPaths():
+        for i in range(1, len(p)):
+            a = (round(p[i - 1].x(), digits), round(p[i - 1].y(), digits))
+            b = (round(p[i].x(), digits), round(p[i].y(), digits))
+            edges.add((min(a, b), max(a, b)))
+    return edges
+
+
+if __name__ == "__main__":
+    import time
+    import random
+
+    random.seed(1)
+
+    # lots of little closed polygons, some touching, like a contour plot
+    segments = []
+    for i in range(20000):
+        cx = round(random.uniform(0, 2000), 1)
+        cy = round(random.uniform(0, 2000), 1)
+        r = random.uniform(2, 10)
+        n = 12
+        pts = [m.Vector2(round(cx + r * math.cos(2 * math.pi * k / n), 1),
+                         round(cy + r * math.sin(2 * math.pi * k / n), 1)) for k in range(n)]
+        for k in range(n):
+            segments.append((pts[k], pts[(k + 1) % n]))
+
+    startTime = time.perf_counter()
+    serial = edgepool.EdgePool()
+    for seg in segments:
+        serial.addEdge(seg)
+    serialTime = time.perf_counter() - startTime
+    print(f"serial: {len(segments)} segments, {len(serial.pathsById)} paths in {serialTime:0.2f}s")
+
+    startTime = time.perf_counter()
+    coords = segmentCoords(segments)
+    elapsed = time.perf_counter() - startTime
+    print(f"packing segments into an array: {elapsed:0.2f}s")
+
+    for processes in sorted({1, 2, os.cpu_count() or 1}):
+        startTime = time.perf_counter()
+        parallel = buildEdgePoolParallel(coords, processes)
+        elapsed = time.perf_counter() - startTime
+        same = edgeSet(parallel) == edgeSet(serial)
+        print(f"{processes} processes: {len(parallel.pathsById)} paths in {elapsed:0.2f}s, same edges: {same}")
+
+    # the speedup can't beat (builds + stitching) / stitching, as only
+    # the builds happen in parallel
+    tiles = chooseTileCounts(os.cpu_count() or 1)
+    job = planTiles(coords, tiles)
+    startWorker(*job)
+    startTime = time.perf_counter()
+    results = [buildTile(tile) for tile in range(tiles[0] * tiles[1])]
+    buildTime = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    stitched = edgepool.EdgePool()
+    stitched.vertices = m.Vector2Array()
+    stitchTiles(stitched, results, job)
+    stitchTime = time.perf_counter() - startTime
+    print(f"{tiles[0]}x{tiles[1]} tiles: {buildTime:0.2f}s building, {stitchTime:0.2f}s stitching")
+
+    # welding isn't transitive, so check small, dense jumbles, where
+    # chains of nearby points run across the seams, against serial
+    # builds. The first is a case where welding each tile on its own
+    # picks the wrong vertex.
+    def serialBuild(segments):
+        ep = edgepool.EdgePool()
+        for seg in segments:
+            ep.addEdge(seg)
+        return ep
+
+    cases = [([(m.Vector2(4.99, 0), m.Vector2(0, 0)),
+               (m.Vector2(5.12, 0), m.Vector2(10, 0)),
+               (m.Vector2(5.06, 0), m.Vector2(10, 5))], (2, 1))]
+    for i in range(200):
+        def randomPoint():
+            return m.Vector2(round(random.uniform(0, 3), 2), round(random.uniform(0, 3), 2))
+        fuzzSegments = []
+        for j in range(random.randint(1, 300)):
+            a = randomPoint()
+            if random.random() < 0.5:
+                b = randomPoint()
+            else:
+                b = m.Vector2(a.x() + random.uniform(-0.3, 0.3), a.y() + random.uniform(-0.3, 0.3))
+            fuzzSegments.append((a, b))
+        cases.append((fuzzSegments, random.choice([(2, 1), (1, 2), (3, 3)])))
+
+    mismatches = 0
+    for fuzzSegments, fuzzTiles in cases:
+        expected = serialBuild(fuzzSegments)
+        got = buildEdgePoolParallel(fuzzSegments, 1, fuzzTiles)
+        if (edgeSet(got) != edgeSet(expected) or
+            [v.components for v in got.vertices] != [v.components for v in expected.vertices]):
+            mismatches += 1
+    print(f"fuzzed against serial builds: {mismatches} of {len(cases)} differ")